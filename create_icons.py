@@ -109,10 +109,12 @@ def main():
     icons_dir.mkdir(exist_ok=True)
     
     print("Generating PNG icons...")
+    # Draw once at the largest size and downsample for the rest
+    base = create_icon_png(max(sizes))
     for size in sizes:
-        img = create_icon_png(size)
+        img = base if size == base.width else base.resize((size, size), Image.LANCZOS)
         png_path = icons_dir / f'icon-{size}x{size}.png'
-        img.save(png_path, 'PNG')
+        img.save(png_path, 'PNG', compress_level=1, optimize=False)
         print(f"Generated: {png_path}")
     
     print("All PNG icons generated successfully!")
@@ -1,19 +1,107 @@
+import logging
+import multiprocessing
 import sqlite3
-import json
+import orjson
 import os
+import zlib
+import numpy as np
 import pandas as pd
 import re
-from datetime import datetime
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from functools import lru_cache, partial
 from typing import List, Dict, Optional, Tuple
 
+logger = logging.getLogger(__name__)
+
 # Use data directory for Render persistent storage
 DATA_DIR = os.environ.get("DATA_DIR", ".")
 DATABASE_PATH = os.path.join(DATA_DIR, "sheets_calendar.db")
 
+# Excel 날짜/전화번호 패턴 (행마다 호출되므로 미리 컴파일)
+_DATE_PATTERNS = tuple(re.compile(p) for p in (
+    r'(\d{2})-(\d{2})-(\d{2})\((\w)\)\s*(\d{1,2}):(\d{2})',
+    r'(\d{4})-(\d{1,2})-(\d{1,2})\s*(\d{1,2}):(\d{2})',
+    r'(\d{2})\.(\d{1,2})\.(\d{1,2})\s*(\d{1,2}):(\d{2})',
+    r'(\d{2})-(\d{1,2})-(\d{1,2})',
+    r'(\d{4})-(\d{1,2})-(\d{1,2})',
+))
+_MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_EXCEL_EPOCH_ORDINAL = date(1899, 12, 30).toordinal()
+_PHONE_RE = re.compile(r'(\d{3})-(\d{3,4})-(\d{4})')
+
+# 헤더 셀 분류표: 앞에서부터 처음 걸리는 항목 하나로만 분류
+_COL_KEYWORDS = (
+    ('name', ('성함', '이름')),
+    ('phone', ('연락처', '전화', '핸드폰')),
+    ('date', ('날짜', '일시', '예약')),
+    ('procedure', ('시술', '수술', '부위')),
+)
+_DATE_CONFIRM_KEYWORDS = ('확정', '일시', '수술일')
+
+# 헤더 행 검색 시 한 번에 문자열 배열로 변환할 행 수 (시트 전체를 한꺼번에 변환하지 않도록)
+_HEADER_SCAN_BLOCK = 20
+
+# One long-lived connection per thread instead of connect/close per call
+_local = threading.local()
+
+def _apply_pragmas(conn: sqlite3.Connection):
+    """WAL lets readers run alongside the writer; NORMAL sync is safe under WAL"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")  # ~20MB page cache per connection
+    # Per-connection setting; lets ON DELETE CASCADE remove a sheet's events
+    conn.execute("PRAGMA foreign_keys=ON")
+
+def _get_conn() -> sqlite3.Connection:
+    """Return the calling thread's connection, opening it on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, isolation_level=None)
+        # Row keeps tuple unpacking working and lets dict(row) build the result dicts
+        conn.row_factory = sqlite3.Row
+        _apply_pragmas(conn)
+        _local.conn = conn
+    return conn
+
+def close_connection():
+    """Close the calling thread's connection (e.g. in the gunicorn master before workers fork)"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+# Handles inherited across fork; kept referenced so they are never closed in the child
+_inherited_conns = []
+
+def reinit_connection() -> sqlite3.Connection:
+    """Give a freshly forked worker its own connection"""
+    inherited = getattr(_local, "conn", None)
+    if inherited is not None:
+        # Closing would touch the parent's locks/WAL state, so only drop it
+        _inherited_conns.append(inherited)
+        _local.conn = None
+    return _get_conn()
+
+@contextmanager
+def _transaction():
+    """Group several statements into one commit (the connection is in autocommit mode)"""
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
 def init_database():
     """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    # Opening the first connection also applies the WAL/sync pragmas
+    cursor = _get_conn().cursor()
     
     # Create sheets table
     cursor.execute("""
@@ -58,243 +146,339 @@ def init_database():
             color TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_processed TIMESTAMP,
-            row_count INTEGER DEFAULT 0
+            row_count INTEGER DEFAULT 0,
+            file_hash TEXT
         )
     """)
     
-    # Create index for better performance
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_date ON events(date)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_sheet_id ON events(sheet_id)")
+    # Latest fetched rows of each sheet, stored once (zlib-compressed JSON) instead of copying
+    # every row into its event's details; a row is looked up by the event's row_index
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sheet_snapshots (
+            sheet_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (sheet_id) REFERENCES sheets (id) ON DELETE CASCADE
+        )
+    """)
     
-    conn.commit()
-    conn.close()
+    # Login sessions: the cookie carries only session_id, the OAuth credentials stay server-side
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            session_id TEXT PRIMARY KEY,
+            credentials TEXT NOT NULL, -- Credentials.to_json()
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Databases created before file_hash existed need the column added
+    excel_columns = {row[1] for row in cursor.execute("PRAGMA table_info(excel_files)")}
+    if 'file_hash' not in excel_columns:
+        cursor.execute("ALTER TABLE excel_files ADD COLUMN file_hash TEXT")
+    
+    # Create index for better performance
+    # (date, time) also serves date-only lookups, so it replaces the old idx_events_date
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_date_time ON events(date, time)")
+    cursor.execute("DROP INDEX IF EXISTS idx_events_date")
+    # (sheet_id, date) covers the per-sheet delete/cascade and per-sheet date-ordered reads
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_sheet_date ON events(sheet_id, date)")
+    cursor.execute("DROP INDEX IF EXISTS idx_events_sheet_id")
+    
+    # upsert_excel_file의 ON CONFLICT(filename) 대상. 인덱스가 없던 DB만 한 번 마이그레이션
+    # (기존 중복 행은 최신 것만 남김)
+    has_filename_index = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_excel_filename'"
+    ).fetchone()
+    if not has_filename_index:
+        cursor.execute("""
+            DELETE FROM excel_files WHERE id NOT IN (SELECT MAX(id) FROM excel_files GROUP BY filename)
+        """)
+        cursor.execute("CREATE UNIQUE INDEX idx_excel_filename ON excel_files(filename)")
 
 def add_sheet(name: str, url: str, color: str, sheet_id: str, gid: str, row_count: int = 0) -> int:
     """Add a new sheet to the database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    cursor = _get_conn().execute("""
         INSERT INTO sheets (name, url, color, sheet_id, gid, row_count)
         VALUES (?, ?, ?, ?, ?, ?)
     """, (name, url, color, sheet_id, gid, row_count))
     
-    sheet_db_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return sheet_db_id
+    return cursor.lastrowid
 
 def get_all_sheets() -> List[Dict]:
     """Get all sheets from database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    cursor = _get_conn().execute("""
         SELECT id, name, url, color, sheet_id, gid, created_at, row_count
         FROM sheets ORDER BY created_at DESC
     """)
     
-    sheets = []
-    for row in cursor.fetchall():
-        sheets.append({
-            "id": row[0],
-            "name": row[1],
-            "url": row[2],
-            "color": row[3],
-            "sheet_id": row[4],
-            "gid": row[5],
-            "created_at": row[6],
-            "row_count": row[7]
-        })
-    
-    conn.close()
-    return sheets
+    return [dict(row) for row in cursor]
 
 def delete_sheet(sheet_id: int) -> bool:
     """Delete a sheet and its events from database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    # Events go with it through ON DELETE CASCADE (foreign_keys is enabled per connection)
+    row = _get_conn().execute("DELETE FROM sheets WHERE id = ? RETURNING id", (sheet_id,)).fetchone()
     
-    # Check if sheet exists
-    cursor.execute("SELECT id FROM sheets WHERE id = ?", (sheet_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return False
-    
-    # Delete events first (cascade should handle this, but being explicit)
-    cursor.execute("DELETE FROM events WHERE sheet_id = ?", (sheet_id,))
-    
-    # Delete sheet
-    cursor.execute("DELETE FROM sheets WHERE id = ?", (sheet_id,))
-    
-    conn.commit()
-    conn.close()
-    return True
+    return row is not None
 
 def clear_events_for_sheet(sheet_id: int):
     """Clear all events for a specific sheet"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM events WHERE sheet_id = ?", (sheet_id,))
-    
-    conn.commit()
-    conn.close()
+    _get_conn().execute("DELETE FROM events WHERE sheet_id = ?", (sheet_id,))
+
+def _stringify_bigints(value):
+    """Copy of value with ints outside the signed 64-bit range turned into their digit strings"""
+    if isinstance(value, dict):
+        return {k: _stringify_bigints(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_stringify_bigints(v) for v in value]
+    if isinstance(value, int) and not -2**63 <= value < 2**64:
+        return str(value)
+    return value
+
+def _dumps(value) -> bytes:
+    """orjson.dumps that also accepts ints wider than 64 bits (numericise_all turns 20+ digit cells into those)"""
+    try:
+        return orjson.dumps(value)
+    except orjson.JSONEncodeError:
+        # 큰 정수는 orjson이 직렬화하지 못하고 읽을 때도 float가 되므로 숫자 그대로의 문자열로 저장
+        return orjson.dumps(_stringify_bigints(value))
 
 def add_event(sheet_id: int, title: str, name: str, date: str, time: str, 
               sheet_name: str, color: str, hospital: str = "", phone: str = "", 
               details: Dict = None):
     """Add an event to the database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    details_json = json.dumps(details) if details else "{}"
+    details_json = _dumps(details or {}).decode()
     
-    cursor.execute("""
+    _get_conn().execute("""
         INSERT INTO events (sheet_id, title, name, date, time, sheet_name, color, hospital, phone, details)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (sheet_id, title, name, date, time, sheet_name, color, hospital, phone, details_json))
-    
-    conn.commit()
-    conn.close()
 
-def get_all_events() -> List[Dict]:
-    """Get all events from database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT title, name, date, time, sheet_name, color, hospital, phone, details
-        FROM events ORDER BY date, time
-    """)
-    
-    events = []
-    for row in cursor.fetchall():
-        try:
-            details = json.loads(row[8]) if row[8] else {}
-        except:
-            details = {}
-            
-        events.append({
-            "title": row[0],
-            "name": row[1],
-            "date": row[2],
-            "time": row[3],
-            "sheet_name": row[4],
-            "color": row[5],
-            "hospital": row[6],
-            "phone": row[7],
-            "details": details
-        })
-    
-    conn.close()
-    return events
+def _event_rows(events: List[Dict], sheet_id: Optional[int]):
+    """Yield INSERT parameter tuples for event dicts"""
+    return (
+        (sheet_id, e['title'], e['name'], e['date'], e['time'], e['sheet_name'], e['color'],
+         e.get('hospital', ""), e.get('phone', ""), _dumps(e.get('details') or {}).decode())
+        for e in events
+    )
+
+def add_events_bulk(events: List[Dict], sheet_id: Optional[int] = None):
+    """Add many events in a single transaction (e.g. the output of process_excel_file)"""
+    with _transaction() as conn:
+        conn.executemany("""
+            INSERT INTO events (sheet_id, title, name, date, time, sheet_name, color, hospital, phone, details)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, _event_rows(events, sheet_id))
+
+def replace_events_for_sheet(sheet_id: int, events: List[Dict], rows: Optional[List[Dict]] = None):
+    """Swap a sheet's cached events for a fresh set in one transaction (readers never see it half-empty)
+    
+    rows, when given, replaces the sheet's snapshot in the same transaction.
+    """
+    snapshot = zlib.compress(_dumps(rows)) if rows is not None else None
+    with _transaction() as conn:
+        conn.execute("DELETE FROM events WHERE sheet_id = ?", (sheet_id,))
+        conn.executemany("""
+            INSERT INTO events (sheet_id, title, name, date, time, sheet_name, color, hospital, phone, details)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, _event_rows(events, sheet_id))
+        if snapshot is not None:
+            conn.execute("""
+                INSERT INTO sheet_snapshots (sheet_id, data) VALUES (?, ?)
+                ON CONFLICT(sheet_id) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+            """, (sheet_id, snapshot))
+
+def get_sheet_row(sheet_id: int, row_index: int) -> Optional[Dict]:
+    """Row of the sheet's snapshot for an event's details.row_index (1-based), None if unknown"""
+    row = _get_conn().execute(
+        "SELECT data FROM sheet_snapshots WHERE sheet_id = ?", (sheet_id,)
+    ).fetchone()
+    if row is None or row_index < 1:
+        return None
+    
+    rows = orjson.loads(zlib.decompress(row[0]))
+    return rows[row_index - 1] if row_index <= len(rows) else None
+
+def _load_details(details_json: Optional[str]) -> Dict:
+    """Decode the details JSON column, falling back to an empty dict"""
+    if not details_json:
+        return {}
+    try:
+        return orjson.loads(details_json)
+    except ValueError:
+        return {}
+
+def _rows_to_events(cursor: sqlite3.Cursor) -> List[Dict]:
+    """Build event dicts from rows of (title, name, date, time, sheet_name, color, hospital, phone, details, sheet_id)"""
+    return [
+        {
+            "title": title,
+            "name": name,
+            "date": date_,
+            "time": time_,
+            "sheet_name": sheet_name,
+            "color": color,
+            "hospital": hospital,
+            "phone": phone,
+            "details": _load_details(details),
+            "sheet_id": sheet_id
+        }
+        for title, name, date_, time_, sheet_name, color, hospital, phone, details, sheet_id in cursor
+    ]
+
+def get_all_events(sheet_id: Optional[int] = None, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """Get events ordered by date and time, optionally only one sheet's, only
+    start_date <= date <= end_date ("YYYY-MM-DD"), and only a limit/offset page of them"""
+    clauses, params = [], []
+    if sheet_id is not None:
+        clauses.append("sheet_id = ?")
+        params.append(sheet_id)
+    if start_date is not None:
+        clauses.append("date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        clauses.append("date <= ?")
+        params.append(end_date)
+    
+    # idx_events_date_time (or idx_events_sheet_date for one sheet) lets SQLite walk the index
+    # in order, so the window and page are applied without loading or sorting every event
+    query = """
+        SELECT title, name, date, time, sheet_name, color, hospital, phone, details, sheet_id
+        FROM events
+    """
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY date, time"
+    if limit is not None or offset:
+        query += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+    
+    return _rows_to_events(_get_conn().execute(query, params))
+
+def get_events_in_range(start_date: str, end_date: str) -> List[Dict]:
+    """Events with start_date <= date < end_date ("YYYY-MM-DD"), ordered by date and time"""
+    # Range scan on idx_events_date_time instead of loading every event
+    cursor = _get_conn().execute("""
+        SELECT title, name, date, time, sheet_name, color, hospital, phone, details, sheet_id
+        FROM events WHERE date >= ? AND date < ? ORDER BY date, time
+    """, (start_date, end_date))
+    
+    return _rows_to_events(cursor)
 
 def get_sheet_by_id(sheet_id: int) -> Optional[Dict]:
     """Get a specific sheet by ID"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    row = _get_conn().execute("""
         SELECT id, name, url, color, sheet_id, gid, created_at, row_count
         FROM sheets WHERE id = ?
-    """, (sheet_id,))
-    
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            "id": row[0],
-            "name": row[1],
-            "url": row[2],
-            "color": row[3],
-            "sheet_id": row[4],
-            "gid": row[5],
-            "created_at": row[6],
-            "row_count": row[7]
-        }
-    return None
+    """, (sheet_id,)).fetchone()
+    
+    return dict(row) if row else None
+
+def save_session_credentials(session_id: str, credentials_json: str):
+    """Store (or replace after a token refresh) the credentials of a login session"""
+    _get_conn().execute("""
+        INSERT INTO user_sessions (session_id, credentials) VALUES (?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET
+            credentials = excluded.credentials, updated_at = CURRENT_TIMESTAMP
+    """, (session_id, credentials_json))
+
+def get_session_credentials(session_id: str) -> Optional[str]:
+    """Credentials JSON of a login session, None if unknown"""
+    row = _get_conn().execute(
+        "SELECT credentials FROM user_sessions WHERE session_id = ?", (session_id,)
+    ).fetchone()
+    
+    return row[0] if row else None
+
+def delete_session(session_id: str):
+    """Forget a login session (logout)"""
+    _get_conn().execute("DELETE FROM user_sessions WHERE session_id = ?", (session_id,))
+
+def delete_stale_sessions(max_idle_days: int):
+    """Drop login sessions whose credentials were not stored or refreshed for max_idle_days"""
+    _get_conn().execute(
+        "DELETE FROM user_sessions WHERE updated_at < datetime('now', ?)", (f"-{max_idle_days} days",)
+    )
 
 # Excel 파일 처리 기능들
 
+# 파일명 키워드 → 병원명, 병원명 → 색상 (호출마다 dict를 새로 만들지 않도록 모듈 상수)
+_HOSPITAL_MAP = {
+    '라비앙': '라비앙성형외과',
+    '트랜드': '트랜드성형외과',
+    '황금피부과': '황금피부과',
+    '셀나인': '셀나인청담',
+    '제네오엑스': '셀나인청담',
+    '케이블린': '케이블린필러',
+    '쥬브겔': '쥬브겔필러'
+}
+_HOSPITAL_RE = re.compile('|'.join(re.escape(key) for key in _HOSPITAL_MAP), re.IGNORECASE)
+
+_HOSPITAL_COLORS = {
+    '라비앙성형외과': '#FF6B6B',
+    '트랜드성형외과': '#4ECDC4',
+    '황금피부과': '#45B7D1',
+    '셀나인청담': '#96CEB4',
+    '케이블린필러': '#FFEAA7',
+    '쥬브겔필러': '#DDA0DD'
+}
+
 def extract_hospital_name_from_filename(filename: str) -> str:
     """파일명에서 병원명 추출"""
-    filename_lower = filename.lower()
-    
-    hospital_mapping = {
-        '라비앙': '라비앙성형외과',
-        '트랜드': '트랜드성형외과',
-        '황금피부과': '황금피부과',
-        '셀나인': '셀나인청담',
-        '제네오엑스': '셀나인청담',
-        '케이블린': '케이블린필러',
-        '쥬브겔': '쥬브겔필러'
-    }
-    
-    for key, hospital in hospital_mapping.items():
-        if key in filename_lower:
-            return hospital
+    match = _HOSPITAL_RE.search(filename)
+    if match:
+        return _HOSPITAL_MAP[match.group().lower()]
     
     return "알 수 없는 병원"
 
 def get_hospital_color(hospital_name: str) -> str:
     """병원별 색상 반환"""
-    colors = {
-        '라비앙성형외과': '#FF6B6B',
-        '트랜드성형외과': '#4ECDC4',
-        '황금피부과': '#45B7D1',
-        '셀나인청담': '#96CEB4',
-        '케이블린필러': '#FFEAA7',
-        '쥬브겔필러': '#DDA0DD'
-    }
-    return colors.get(hospital_name, '#95A5A6')
+    return _HOSPITAL_COLORS.get(hospital_name, '#95A5A6')
+
+def _valid_ymd(y: int, m: int, d: int) -> bool:
+    """연/월/일 조합이 실제 존재하는 날짜인지 확인 (윤년 포함)"""
+    if y < 1 or not 1 <= m <= 12:
+        return False
+    leap = m == 2 and y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)
+    return 1 <= d <= _MONTH_DAYS[m - 1] + leap
 
 def parse_date_time(date_str) -> Tuple[Optional[str], Optional[str]]:
     """날짜 문자열을 파싱해서 날짜와 시간으로 분리"""
     if pd.isna(date_str) or not str(date_str).strip():
         return None, None
     
-    date_str = str(date_str).strip()
-    
-    # Excel에서 숫자로 저장된 날짜 처리
+    return _parse_date_time_cached(str(date_str).strip())
+
+@lru_cache(maxsize=8192)
+def _parse_date_time_cached(date_str: str) -> Tuple[Optional[str], Optional[str]]:
+    """parse_date_time 본체 (같은 예약일 문자열이 여러 행에 반복되므로 결과를 캐시)"""
+    # Excel에서 숫자로 저장된 날짜 처리 (시리얼 번호 → 1899-12-30 기준 일수)
     try:
         if date_str.replace('.', '').replace('-', '').isdigit():
             excel_date = float(date_str)
             if excel_date > 40000:  # Excel의 날짜 시리얼 번호
-                from datetime import timedelta
-                excel_epoch = datetime(1900, 1, 1)
-                actual_date = excel_epoch + timedelta(days=excel_date - 2)
-                return actual_date.strftime("%Y-%m-%d"), "09:00"
-    except:
+                actual_date = date.fromordinal(_EXCEL_EPOCH_ORDINAL + int(excel_date))
+                return f"{actual_date.year:04d}-{actual_date.month:02d}-{actual_date.day:02d}", "09:00"
+    except (ValueError, OverflowError):
         pass
     
     # 다양한 날짜 형식 처리
-    patterns = [
-        r'(\d{2})-(\d{2})-(\d{2})\((\w)\)\s*(\d{1,2}):(\d{2})',
-        r'(\d{4})-(\d{1,2})-(\d{1,2})\s*(\d{1,2}):(\d{2})',
-        r'(\d{2})\.(\d{1,2})\.(\d{1,2})\s*(\d{1,2}):(\d{2})',
-        r'(\d{2})-(\d{1,2})-(\d{1,2})',
-        r'(\d{4})-(\d{1,2})-(\d{1,2})',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, date_str)
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(date_str)
         if match:
             groups = match.groups()
             
             if len(groups) >= 3:
-                year, month, day = groups[0], groups[1], groups[2]
+                year, month, day = int(groups[0]), int(groups[1]), int(groups[2])
                 
                 # 2자리 년도를 4자리로 변환
-                if len(year) == 2:
-                    year_int = int(year)
-                    year = "20" + year if year_int < 50 else "19" + year
+                if len(groups[0]) == 2:
+                    year += 2000 if year < 50 else 1900
                 
-                try:
-                    date_formatted = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-                    datetime.strptime(date_formatted, "%Y-%m-%d")
+                # strptime 대신 정수 비교로 날짜 검증
+                if _valid_ymd(year, month, day):
+                    date_formatted = f"{year:04d}-{month:02d}-{day:02d}"
                     
                     # 시간 정보가 있으면 추출
                     if len(groups) >= 6:
@@ -303,8 +487,6 @@ def parse_date_time(date_str) -> Tuple[Optional[str], Optional[str]]:
                         time_formatted = "09:00"
                     
                     return date_formatted, time_formatted
-                except ValueError:
-                    pass
     
     return None, None
 
@@ -314,15 +496,13 @@ def extract_phone_number(text) -> str:
         return ""
     
     text = str(text)
-    phone_pattern = r'(\d{3})-(\d{3,4})-(\d{4})'
-    match = re.search(phone_pattern, text)
+    match = _PHONE_RE.search(text)
     if match:
         return match.group()
     
-    # 숫자만 있는 경우 포맷팅
-    numbers = re.findall(r'\d+', text)
-    if numbers:
-        phone_str = ''.join(numbers)
+    # 숫자만 있는 경우 포맷팅 (\d와 같은 기준인 isdecimal로 한 번에 숫자만 남김)
+    phone_str = ''.join(filter(str.isdecimal, text))
+    if phone_str:
         if len(phone_str) == 11 and phone_str.startswith('010'):
             return f"{phone_str[:3]}-{phone_str[3:7]}-{phone_str[7:]}"
         elif len(phone_str) == 10:
@@ -330,181 +510,257 @@ def extract_phone_number(text) -> str:
     
     return text
 
+def _locate_header_row(values: np.ndarray) -> int:
+    """'성함'/'이름'이 들어있는 첫 행 번호 (np.char로 블록 단위 검색, 없으면 -1)"""
+    for start in range(0, len(values), _HEADER_SCAN_BLOCK):
+        block = values[start:start + _HEADER_SCAN_BLOCK].astype(str)
+        mask = (np.char.find(block, '성함') >= 0) | (np.char.find(block, '이름') >= 0)
+        hits = np.flatnonzero(mask.any(axis=1))
+        if hits.size:
+            return start + int(hits[0])
+    return -1
+
 def find_header_row(df: pd.DataFrame) -> Tuple[int, Dict[str, int]]:
     """헤더 행과 컬럼 매핑을 찾는 함수"""
-    for idx, row in df.iterrows():
-        if row.astype(str).str.contains('성함|이름', case=False, na=False).any():
-            columns_mapping = {}
-            for col_idx, cell_value in enumerate(row):
-                if pd.isna(cell_value):
-                    continue
-                
-                cell_str = str(cell_value).lower()
-                if '성함' in cell_str or '이름' in cell_str:
-                    columns_mapping['name'] = col_idx
-                elif '연락처' in cell_str or '전화' in cell_str or '핸드폰' in cell_str:
-                    columns_mapping['phone'] = col_idx
-                elif '날짜' in cell_str or '일시' in cell_str or '예약' in cell_str:
-                    if '확정' in cell_str or '일시' in cell_str or '수술일' in cell_str:
-                        columns_mapping['date'] = col_idx
-                elif '시술' in cell_str or '수술' in cell_str or '부위' in cell_str:
-                    columns_mapping['procedure'] = col_idx
-            
-            return idx, columns_mapping
-    
-    return -1, {}
-
-def add_excel_file(filename: str, file_path: str, hospital_name: str = None) -> int:
-    """Excel 파일 정보를 데이터베이스에 추가"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    if not hospital_name:
-        hospital_name = extract_hospital_name_from_filename(filename)
-    
-    color = get_hospital_color(hospital_name)
-    
-    cursor.execute("""
-        INSERT INTO excel_files (filename, file_path, hospital_name, color)
-        VALUES (?, ?, ?, ?)
-    """, (filename, file_path, hospital_name, color))
-    
-    file_db_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return file_db_id
+    values = df.to_numpy()
+    idx = _locate_header_row(values)
+    if idx == -1:
+        return -1, {}
+    
+    # 컬럼 분류는 찾은 헤더 행 하나에 대해서만 수행
+    columns_mapping = {}
+    for col_idx, cell_value in enumerate(values[idx]):
+        if pd.isna(cell_value):
+            continue
+        
+        cell_str = str(cell_value).lower()
+        for key, keywords in _COL_KEYWORDS:
+            if any(keyword in cell_str for keyword in keywords):
+                # 날짜 계열은 확정/일시/수술일이 함께 있을 때만 날짜 컬럼으로 인정
+                if key != 'date' or any(keyword in cell_str for keyword in _DATE_CONFIRM_KEYWORDS):
+                    columns_mapping[key] = col_idx
+                break
+    
+    return idx, columns_mapping
 
 def get_all_excel_files() -> List[Dict]:
     """모든 Excel 파일 목록 반환"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    cursor = _get_conn().execute("""
         SELECT id, filename, file_path, hospital_name, color, created_at, last_processed, row_count
         FROM excel_files ORDER BY created_at DESC
     """)
     
-    files = []
-    for row in cursor.fetchall():
-        files.append({
-            "id": row[0],
-            "filename": row[1],
-            "file_path": row[2],
-            "hospital_name": row[3],
-            "color": row[4],
-            "created_at": row[5],
-            "last_processed": row[6],
-            "row_count": row[7]
-        })
-    
-    conn.close()
-    return files
-
-def process_excel_file(file_path: str) -> List[Dict]:
-    """Excel 파일을 처리해서 예약 정보 추출"""
+    return [dict(row) for row in cursor]
+
+def _process_one_sheet(file_path: str, filename: str, hospital_name: str, color: str,
+                       sheet_name: str, df: pd.DataFrame) -> List[Dict]:
+    """이미 읽은 시트 하나에서 예약 정보 추출 (프로세스 풀에서 피클링되도록 모듈 수준 함수)"""
+    appointments = []
+    
+    try:
+        if df.empty:
+            return appointments
+        
+        # 헤더 행과 컬럼 매핑 찾기
+        header_row, columns_mapping = find_header_row(df)
+        
+        if header_row == -1 or 'name' not in columns_mapping:
+            return appointments
+        
+        # 데이터 행 처리: 필요한 컬럼만 ndarray로 한 번 꺼내서 순회
+        data_start = header_row + 1
+        rows = df.iloc[data_start:]
+        
+        # 이름이 비어있는 행은 pandas 마스크로 한 번에 걸러서 Python 루프에 넘기지 않음
+        name_series = rows.iloc[:, columns_mapping['name']]
+        name_mask = name_series.notna() & name_series.astype(str).str.strip().ne('')
+        rows = rows[name_mask.to_numpy()]
+        
+        positions = np.flatnonzero(name_mask.to_numpy())
+        name_col = rows.iloc[:, columns_mapping['name']].to_numpy()
+        phone_col = rows.iloc[:, columns_mapping['phone']].to_numpy() if 'phone' in columns_mapping else None
+        date_col = rows.iloc[:, columns_mapping['date']].to_numpy() if 'date' in columns_mapping else None
+        proc_col = rows.iloc[:, columns_mapping['procedure']].to_numpy() if 'procedure' in columns_mapping else None
+        
+        for i in range(len(name_col)):
+            idx = data_start + int(positions[i])
+            name = str(name_col[i]).strip()
+            
+            # 전화번호 추출
+            phone = ""
+            if phone_col is not None:
+                phone = extract_phone_number(phone_col[i])
+            
+            # 날짜/시간 추출
+            appointment_date, appointment_time = None, None
+            if date_col is not None:
+                appointment_date, appointment_time = parse_date_time(date_col[i])
+            
+            # 시술 정보
+            procedure = ""
+            if proc_col is not None:
+                proc_value = proc_col[i]
+                if proc_value is not None and proc_value == proc_value:
+                    procedure = str(proc_value).strip()
+            
+            if appointment_date:  # 날짜가 있는 경우만 추가
+                appointment = {
+                    'title': f"{hospital_name}_{name}",
+                    'name': name,
+                    'date': appointment_date,
+                    'time': appointment_time or "09:00",
+                    'sheet_name': f"{filename}_{sheet_name}",
+                    'color': color,
+                    'hospital': hospital_name,
+                    'phone': phone,
+                    'details': {
+                        'procedure': procedure,
+                        'sheet_name': sheet_name,
+                        'row_index': idx + 1,
+                        'file_path': file_path
+                    }
+                }
+                
+                appointments.append(appointment)
+    
+    except Exception as e:
+        logger.warning("Error processing sheet %s: %s", sheet_name, e)
+    
+    return appointments
+
+def get_file_fingerprint(file_path: str) -> str:
+    """파일 변경 여부 판단용 지문 (수정 시각 ns + 크기)"""
+    st = os.stat(file_path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+# Excel 이벤트는 details.file_path로 파일을 구분 (sheet_name LIKE '파일명_%'는 파일명의 _/%가
+# 와일드카드가 되고, 파일명이 다른 파일명의 접두어이면 그 파일의 이벤트까지 걸림)
+_EXCEL_EVENTS_WHERE = "json_extract(details, '$.file_path') = ?"
+
+def get_events_for_excel_file(file_path: str) -> List[Dict]:
+    """Excel 파일에서 저장된 이벤트를 처리 순서대로 반환 (process_excel_file 결과와 같은 형태)"""
+    cursor = _get_conn().execute(f"""
+        SELECT title, name, date, time, sheet_name, color, hospital, phone, details, sheet_id
+        FROM events WHERE {_EXCEL_EVENTS_WHERE} ORDER BY id
+    """, (file_path,))
+    
+    events = _rows_to_events(cursor)
+    for event in events:
+        del event["sheet_id"]  # 새로 파싱한 예약에는 없는 키
+    return events
+
+def parse_excel_file(file_path: str, workers: int = 1) -> Tuple[List[Dict], Optional[str]]:
+    """Excel 파일을 처리해서 (예약 정보, 파싱 전에 잡은 파일 지문) 반환.
+    
+    workers > 1이면 시트들을 spawn 프로세스 풀에서 처리 (배치/CLI용, 호출 스크립트에 __main__ 가드 필요;
+    서버 요청 경로는 기본값 1로 인라인 처리)
+    지문은 이벤트를 저장한 뒤 upsert_excel_file(file_hash=...)에 넘김 (파싱 도중이나 뒤에
+    바뀐 파일이 처리된 것으로 기록되지 않도록, 저장 시점이 아니라 파싱 전 지문을 씀)
+    """
     appointments = []
     filename = os.path.basename(file_path)
     hospital_name = extract_hospital_name_from_filename(filename)
     color = get_hospital_color(hospital_name)
     
+    # 마지막 처리 이후 파일이 바뀌지 않았으면 다시 파싱하지 않고 저장된 이벤트 사용
     try:
-        # Excel 파일의 모든 시트 읽기
-        excel_file = pd.ExcelFile(file_path)
+        fingerprint = get_file_fingerprint(file_path)
+    except OSError:
+        fingerprint = None
+    
+    if fingerprint:
+        # upsert_excel_file과 같은 키(filename)로 찾고, 같은 경로의 같은 파일일 때만 재사용
+        row = _get_conn().execute(
+            "SELECT file_path, file_hash FROM excel_files WHERE filename = ?", (filename,)
+        ).fetchone()
+        if row and row[0] == file_path and row[1] == fingerprint:
+            return get_events_for_excel_file(file_path), fingerprint
+    
+    try:
+        # Excel 파일의 모든 시트 읽기 (openpyxl 대신 Rust 기반 calamine 엔진)
+        # 워크북은 여기서 한 번만 열고, 시트는 읽은 DataFrame으로 넘김 (워커가 다시 열지 않음)
+        excel_file = pd.ExcelFile(file_path, engine='calamine')
+        sheet_names = excel_file.sheet_names
+        process_sheet = partial(_process_one_sheet, file_path, filename, hospital_name, color)
         
-        for sheet_name in excel_file.sheet_names:
-            try:
+        def read_sheets():
+            for sheet_name in sheet_names:
                 # 시트 읽기 (헤더 없이)
-                df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-                
-                if df.empty:
-                    continue
-                
-                # 헤더 행과 컬럼 매핑 찾기
-                header_row, columns_mapping = find_header_row(df)
-                
-                if header_row == -1 or 'name' not in columns_mapping:
-                    continue
-                
-                # 데이터 행 처리
-                for idx in range(header_row + 1, len(df)):
-                    row = df.iloc[idx]
-                    
-                    # 이름이 있는지 확인
-                    name_value = row.iloc[columns_mapping['name']] if 'name' in columns_mapping else None
-                    if pd.isna(name_value) or not str(name_value).strip():
-                        continue
-                    
-                    name = str(name_value).strip()
-                    
-                    # 전화번호 추출
-                    phone = ""
-                    if 'phone' in columns_mapping:
-                        phone_value = row.iloc[columns_mapping['phone']]
-                        phone = extract_phone_number(phone_value)
-                    
-                    # 날짜/시간 추출
-                    appointment_date, appointment_time = None, None
-                    if 'date' in columns_mapping:
-                        date_value = row.iloc[columns_mapping['date']]
-                        appointment_date, appointment_time = parse_date_time(date_value)
-                    
-                    # 시술 정보
-                    procedure = ""
-                    if 'procedure' in columns_mapping:
-                        proc_value = row.iloc[columns_mapping['procedure']]
-                        if not pd.isna(proc_value):
-                            procedure = str(proc_value).strip()
-                    
-                    if appointment_date:  # 날짜가 있는 경우만 추가
-                        appointment = {
-                            'title': f"{hospital_name}_{name}",
-                            'name': name,
-                            'date': appointment_date,
-                            'time': appointment_time or "09:00",
-                            'sheet_name': f"{filename}_{sheet_name}",
-                            'color': color,
-                            'hospital': hospital_name,
-                            'phone': phone,
-                            'details': {
-                                'procedure': procedure,
-                                'sheet_name': sheet_name,
-                                'row_index': idx + 1,
-                                'file_path': file_path
-                            }
-                        }
-                        
-                        appointments.append(appointment)
-                        
-            except Exception as e:
-                print(f"Error processing sheet {sheet_name}: {str(e)}")
-                continue
+                try:
+                    yield sheet_name, excel_file.parse(sheet_name, header=None)
+                except Exception as e:
+                    logger.warning("Error processing sheet %s: %s", sheet_name, e)
+        
+        if workers > 1 and len(sheet_names) > 1:
+            sheets = list(read_sheets())
+            names = [sheet_name for sheet_name, _ in sheets]
+            frames = [df for _, df in sheets]
+            # 스레드가 도는 서버 프로세스를 fork하지 않도록 spawn 컨텍스트 사용
+            with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names)),
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                for sheet_appointments in executor.map(process_sheet, names, frames):
+                    appointments.extend(sheet_appointments)
+        else:
+            for sheet_name, df in read_sheets():
+                appointments.extend(process_sheet(sheet_name, df))
                 
     except Exception as e:
-        print(f"Error processing file {filename}: {str(e)}")
+        logger.warning("Error processing file %s: %s", filename, e)
+        fingerprint = None  # 실패한 파일은 처리된 것으로 기록하지 않음
     
-    return appointments
+    return appointments, fingerprint
 
-def clear_events_for_excel_file(filename: str):
-    """Excel 파일에 해당하는 모든 이벤트 삭제"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM events WHERE sheet_name LIKE ?", (f"{filename}_%",))
-    
-    conn.commit()
-    conn.close()
+def process_excel_file(file_path: str, workers: int = 1) -> List[Dict]:
+    """Excel 파일을 처리해서 예약 정보 추출"""
+    return parse_excel_file(file_path, workers)[0]
 
-def update_excel_file_processed(filename: str, row_count: int):
-    """Excel 파일 처리 정보 업데이트"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+def clear_events_for_excel_file(file: str):
+    """Excel 파일에 해당하는 모든 이벤트 삭제 (file은 파일 경로, 또는 예전 호출처럼 파일명만).
+    
+    저장된 지문도 지워서 다음 process_excel_file이 비워진 events 대신 파일을 다시 파싱하게 함
+    """
+    filename = os.path.basename(file)
+    
+    with _transaction() as conn:
+        if filename == file:
+            # 파일명만 넘어오면 그 이름을 가진 모든 경로 (sheet_name은 '파일명_시트명', 접두어는 LIKE 없이 비교)
+            prefix = f"{filename}_"
+            file_paths = [
+                row[0] for row in conn.execute(
+                    "SELECT DISTINCT json_extract(details, '$.file_path') FROM events WHERE substr(sheet_name, 1, ?) = ?",
+                    (len(prefix), prefix)
+                )
+                if row[0] and os.path.basename(row[0]) == filename
+            ]
+        else:
+            file_paths = [file]
+        
+        for file_path in file_paths:
+            conn.execute(f"DELETE FROM events WHERE {_EXCEL_EVENTS_WHERE}", (file_path,))
+        conn.execute("UPDATE excel_files SET file_hash = NULL WHERE filename = ?", (filename,))
+
+def upsert_excel_file(filename: str, file_path: str, hospital_name: str = None, row_count: int = 0,
+                      file_hash: Optional[str] = None) -> int:
+    """Excel 파일 정보와 처리 결과를 한 번에 추가 또는 갱신.
     
-    cursor.execute("""
-        UPDATE excel_files 
-        SET last_processed = CURRENT_TIMESTAMP, row_count = ?
-        WHERE filename = ?
-    """, (row_count, filename))
+    file_hash는 parse_excel_file이 파싱 전에 잡은 지문 (없으면 다음 처리 때 다시 파싱)
+    """
+    if not hospital_name:
+        hospital_name = extract_hospital_name_from_filename(filename)
+    
+    color = get_hospital_color(hospital_name)
     
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    row = _get_conn().execute("""
+        INSERT INTO excel_files (filename, file_path, hospital_name, color, last_processed, row_count, file_hash)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
+        ON CONFLICT(filename) DO UPDATE SET
+            file_path = excluded.file_path,
+            hospital_name = excluded.hospital_name,
+            color = excluded.color,
+            last_processed = CURRENT_TIMESTAMP,
+            row_count = excluded.row_count,
+            file_hash = excluded.file_hash
+        RETURNING id
+    """, (filename, file_path, hospital_name, color, row_count, file_hash)).fetchone()
+    
+    return row[0]
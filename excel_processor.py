@@ -1,25 +1,59 @@
-import pandas as pd
-import openpyxl
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import re
 import os
 import glob
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable
 import sqlite3
 import json
 
+# 날짜 패턴 (셀마다 호출되므로 미리 컴파일)
+_DATE_PATTERNS = tuple(re.compile(p) for p in (
+    r'(\d{2})-(\d{2})-(\d{2})\((\w)\)\s*(\d{1,2}):(\d{2})',
+    r'(\d{4})-(\d{1,2})-(\d{1,2})\s*(\d{1,2}):(\d{2})',
+    r'(\d{2})\.(\d{1,2})\.(\d{1,2})\s*(\d{1,2}):(\d{2})',
+    r'(\d{2})-(\d{1,2})-(\d{1,2})',
+    r'(\d{4})-(\d{1,2})-(\d{1,2})',
+))
+
+# 병원/의원/피부과 판별 키워드와 한 번에 검사하는 정규식
+HOSPITAL_KEYWORDS = frozenset(['병원', '의원', '피부과', '외과', '클리닉', '센터', '성형외과', '정형외과', '내과', '산부인과', '소아과', '치과', '한의원'])
+_HOSPITAL_RE = re.compile('|'.join(map(re.escape, sorted(HOSPITAL_KEYWORDS, key=len, reverse=True))))
+
+# Excel 날짜 시리얼 번호 후보 (숫자와 소수점 하나, 임시 문자열을 만들지 않고 판별)
+_EXCEL_SERIAL_RE = re.compile(r'\d+\.?\d*|\.\d+')
+
+# 헤더 행 판별용 ('성함'/'이름'이 들어있는 셀)
+_NAME_HEADER_RE = re.compile('성함|이름')
+
 class ExcelHospitalProcessor:
     """Excel 파일에서 병원/의원/피부과 정보를 추출하는 클래스"""
     
     def __init__(self, excel_directory: str, database_path: str = "hospital_calendar.db"):
         self.excel_directory = excel_directory
         self.database_path = database_path
-        self.hospital_keywords = ['병원', '의원', '피부과', '외과', '클리닉', '센터', '성형외과', '정형외과', '내과', '산부인과', '소아과', '치과', '한의원']
+        self.hospital_keywords = HOSPITAL_KEYWORDS
+        self._conn = None
         self.init_database()
     
+    def get_connection(self) -> sqlite3.Connection:
+        """처리기 전체에서 재사용하는 SQLite 연결 (처음 호출 시 연결하고 PRAGMA 설정)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.database_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn.execute("PRAGMA cache_size=-20000")
+        return self._conn
+    
+    def close(self):
+        """연결 닫기"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
     def init_database(self):
         """데이터베이스 초기화"""
-        conn = sqlite3.connect(self.database_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -50,8 +84,12 @@ class ExcelHospitalProcessor:
             )
         """)
         
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_appointments_file_sheet
+            ON hospital_appointments(file_name, sheet_name)
+        """)
+        
         conn.commit()
-        conn.close()
     
     def extract_hospital_name_from_filename(self, filename: str) -> str:
         """파일명에서 병원명 추출"""
@@ -74,14 +112,19 @@ class ExcelHospitalProcessor:
         
         return "알 수 없는 병원"
     
-    def find_header_row(self, df: pd.DataFrame) -> Tuple[int, Dict[str, int]]:
-        """헤더 행과 컬럼 매핑을 찾는 함수"""
-        for idx, row in df.iterrows():
-            if row.astype(str).str.contains('성함|이름', case=False, na=False).any():
+    def has_hospital_keyword(self, text) -> bool:
+        """텍스트에 병원 키워드가 들어있는지 (키워드마다 in 검사하는 대신 정규식 한 번)"""
+        return bool(text) and _HOSPITAL_RE.search(str(text)) is not None
+    
+    def find_header_row(self, rows: Iterable[list]) -> Tuple[int, Dict[str, int]]:
+        """헤더 행과 컬럼 매핑을 찾는 함수 (행은 셀 값 리스트)"""
+        for idx, row in enumerate(rows):
+            # 셀마다 정규식을 돌리지 않고 행 전체를 이어붙인 문자열에 한 번만 검색
+            if _NAME_HEADER_RE.search('\x01'.join(map(str, row))):
                 # 헤더 행 찾음
                 columns_mapping = {}
                 for col_idx, cell_value in enumerate(row):
-                    if pd.isna(cell_value):
+                    if cell_value is None or cell_value == '':
                         continue
                     
                     cell_str = str(cell_value).lower()
@@ -101,36 +144,50 @@ class ExcelHospitalProcessor:
     
     def parse_date_time(self, date_str: str) -> Tuple[Optional[str], Optional[str]]:
         """날짜 문자열을 파싱해서 날짜와 시간으로 분리"""
-        if pd.isna(date_str) or not str(date_str).strip():
+        # 빈 셀/NaN (x != x 는 NaN 검사)
+        if date_str is None or date_str != date_str or not str(date_str).strip():
             return None, None
         
         date_str = str(date_str).strip()
         
         # Excel에서 숫자로 저장된 날짜 처리
-        try:
-            if date_str.replace('.', '').isdigit():
+        if _EXCEL_SERIAL_RE.fullmatch(date_str):
+            try:
                 excel_date = float(date_str)
                 if excel_date > 40000:  # Excel의 날짜 시리얼 번호
-                    from datetime import datetime, timedelta
                     excel_epoch = datetime(1900, 1, 1)
                     actual_date = excel_epoch + timedelta(days=excel_date - 2)
                     return actual_date.strftime("%Y-%m-%d"), "09:00"
-        except:
-            pass
+            except (ValueError, OverflowError):
+                pass
         
         # 다양한 날짜 형식 처리
-        patterns = [
-            r'(\d{2})-(\d{2})-(\d{2})\((\w)\)\s*(\d{1,2}):(\d{2})',
-            r'(\d{4})-(\d{1,2})-(\d{1,2})\s*(\d{1,2}):(\d{2})',
-            r'(\d{2})\.(\d{1,2})\.(\d{1,2})\s*(\d{1,2}):(\d{2})',
-            r'(\d{2})-(\d{1,2})-(\d{1,2})',
-            r'(\d{4})-(\d{1,2})-(\d{1,2})',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, date_str)
+        for pattern in _DATE_PATTERNS:
+            match = pattern.search(date_str)
             if match:
                 groups = match.groups()
                 
                 if len(groups) >= 3:
-                    year, month, day = groups[0
\ No newline at end of file
+                    year, month, day = groups[0], groups[1], groups[2]
+                    
+                    # 2자리 년도를 4자리로 변환
+                    if len(year) == 2:
+                        year_int = int(year)
+                        year = "20" + year if year_int < 50 else "19" + year
+                    
+                    try:
+                        # 유효한 날짜인지 확인 (strptime으로 다시 파싱하지 않고 정수로 바로 생성)
+                        date(int(year), int(month), int(day))
+                        date_formatted = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+                        
+                        # 시간 정보가 있으면 추출
+                        if len(groups) >= 6:
+                            time_formatted = f"{groups[-2].zfill(2)}:{groups[-1]}"
+                        else:
+                            time_formatted = "09:00"
+                        
+                        return date_formatted, time_formatted
+                    except ValueError:
+                        pass
+        
+        return None, None
@@ -6,7 +6,7 @@ bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
 worker_class = "uvicorn.workers.UvicornWorker"
 worker_connections = 1000
 timeout = 30
@@ -30,4 +30,15 @@ daemon = False
 pidfile = "/tmp/gunicorn.pid"
 user = None
 group = None
-tmp_upload_dir = None
\ No newline at end of file
+tmp_upload_dir = None
+
+# Server hooks
+# SQLite connections must not cross fork: the master closes the one opened by
+# init_database() at import, and each worker opens its own
+def when_ready(server):
+    from database import close_connection
+    close_connection()
+
+def post_fork(server, worker):
+    from database import reinit_connection
+    reinit_connection()
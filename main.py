@@ -1,22 +1,51 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
 import re
+import bisect
 from typing import List, Dict, Optional
+from functools import lru_cache
 import uvicorn
 import gspread
+from gspread.utils import numericise_all, fill_gaps, absolute_range_name
+from gspread.urls import DRIVE_FILES_API_V3_URL, SPREADSHEET_URL, SPREADSHEET_VALUES_BATCH_URL
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 import os
 import json
+import orjson
+import logging
+import asyncio
+import threading
+import time
+import secrets
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from database import (init_database, add_sheet as db_add_sheet, get_all_sheets as db_get_sheets, 
-                      delete_sheet as db_delete_sheet, clear_events_for_sheet, add_event as db_add_event, 
-                      get_all_events as db_get_events)
+                      delete_sheet as db_delete_sheet, replace_events_for_sheet, 
+                      get_all_events as db_get_events, get_events_in_range as db_get_events_in_range,
+                      get_sheet_by_id, get_sheet_row as db_get_sheet_row,
+                      save_session_credentials, get_session_credentials, delete_session,
+                      delete_stale_sessions)
 
-app = FastAPI()
+# LOG_LEVEL=DEBUG shows the per-row/per-column diagnostics; the default INFO keeps only per-sheet progress
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Signed session cookie holding only the login session id (credentials live in SQLite).
+# Without SECRET_KEY a per-process key is used, so sessions do not survive a restart.
+_SECRET_KEY = os.getenv("SECRET_KEY")
+if not _SECRET_KEY:
+    logger.warning("SECRET_KEY is not set; using a temporary key (sessions end on restart)")
+    _SECRET_KEY = secrets.token_urlsafe(32)
+app.add_middleware(SessionMiddleware, secret_key=_SECRET_KEY, same_site="lax")
 
 # Static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -31,45 +60,254 @@ SCOPES = [
 # Initialize database on startup
 init_database()
 
-# Global variable to store credentials
-user_credentials = None
+# Blocking Google/SQLite work runs through asyncio.to_thread; the default executor
+# (min(32, cpu + 4) threads) is only 5 threads on a 1-CPU instance, fewer than the
+# refreshes that may be waiting on _google_fetch_slots plus the other requests
+_THREAD_POOL_SIZE = 32
+
+@app.on_event("startup")
+async def configure_thread_pool():
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=_THREAD_POOL_SIZE, thread_name_prefix="blocking-io")
+    )
+
+# Per login session: credentials loaded from user_sessions with their authorized gspread
+# client, and each spreadsheet's worksheet titles by gid, kept for a short TTL
+_SPREADSHEET_CACHE_TTL = 60
+_google_cache_lock = threading.Lock()
+_SESSION_CLIENT_CACHE_SIZE = 256  # 최근에 쓴 세션만 메모리에 (나머지는 다음 요청 때 SQLite에서 다시 읽음)
+_session_clients: "OrderedDict[str, tuple]" = OrderedDict()  # session_id -> (credentials, client)
+_spreadsheet_cache: Dict[tuple, tuple] = {}  # (session_id, sheet_id) -> (expires_at, {gid: title}, first title)
+
+# Fetched rows per worksheet, so repeated /api/events polls within the TTL skip the network
+_SHEET_DATA_CACHE_TTL = 30
+_sheet_data_cache: Dict[tuple, tuple] = {}  # (session_id, sheet_id, gid) -> (expires_at, records)
+
+# Refreshes run per spreadsheet in worker threads; at most this many talk to Google at
+# once (Sheets API per-user quota), the rest wait in their thread
+_GOOGLE_FETCH_CONCURRENCY = 5
+_google_fetch_slots = threading.BoundedSemaphore(_GOOGLE_FETCH_CONCURRENCY)
+
+# /, /api/events and the monthly view answer from SQLite and refresh in the background; hits
+# within the interval or while one is running start no other
+# (keyed by sheet_id, None = all sheets)
+_BACKGROUND_REFRESH_INTERVAL = 10
+_last_background_refresh: Dict[Optional[int], float] = {}
+_refresh_tasks: Dict[Optional[int], asyncio.Task] = {}
+# Refreshes running right now per scope (same keys) with their force flag; overlapping calls
+# (repeated force=1, add_sheet while /api/events polls) await the running one instead of
+# fetching the same sheets again. A forced call never settles for an unforced one
+_running_refreshes: Dict[Optional[int], tuple] = {}  # scope -> (task, force)
+
+# Records each sheet's stored events were built from; a refresh that gets the same list back
+# from _sheet_data_cache has nothing new, so mappings/hospital/events are not derived again
+_processed_sheet_data: Dict[int, tuple] = {}  # db sheet id -> (records, name, color)
+# find_column_mappings only reads the first _COLUMN_MAPPING_ROWS rows, so when those are
+# unchanged (only rows further down were added/edited) the previous mappings still hold
+_column_mappings_cache: Dict[int, tuple] = {}  # db sheet id -> (leading rows, mappings)
+# Drive modifiedTime of the spreadsheet when each sheet's events were last stored; while it is
+# unchanged a refresh skips the values request for that sheet (kept in memory so a restart,
+# e.g. after a parsing change, rebuilds every sheet once)
+_sheet_source_modified: Dict[int, str] = {}  # db sheet id -> modifiedTime
+
+# Regexes used per request/per cell, compiled once
+# JSON 자격 증명에서 지울 제어 문자 (\t, \n, \r는 유지) - str.translate용 삭제 테이블
+_CONTROL_CHARS_TABLE = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), *range(0x7f, 0xa0)], None
+)
+_SHEET_ID_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
+_GID_RE = re.compile(r'[#&]gid=([0-9]+)')
+_PHONE_PATTERNS = (re.compile(r'010-\d{4}-\d{4}'), re.compile(r'\d{3}-\d{3,4}-\d{4}'))
+# 병원 판별 키워드 (셀마다 any(... in ...)를 돌리지 않도록 한 번의 정규식 검색으로)
+_STELLA_RE = re.compile('스텔라|뉴브|엠투투|m2m')  # 스텔라엠투투_뉴브의원
+_GENEOEX_RE = re.compile('제네오엑스|셀나인')  # 제네오엑스_셀나인청담
+_HOSPITAL_KEYWORD_RE = re.compile('병원|의원|피부과|외과|클리닉|센터')
+_HOSPITAL_SUFFIX_RE = re.compile('병원|의원|피부과|외과')
+# 시트명 키워드 -> 병원명 (호출마다 dict를 만들지 않도록 모듈에 한 번; 순서가 우선순위라
+# 가장 앞 위치를 찾는 정규식 alternation으로 바꾸면 여러 키워드가 있는 시트명의 결과가 달라짐)
+_SHEET_NAME_HOSPITALS = (
+    ('라비앙', '라비앙성형외과'),
+    ('트랜드', '트랜드성형외과'),
+    ('황금', '황금피부과'),
+    ('셀나인', '셀나인청담'),
+    ('제네오엑스', '뉴브의원'),
+    ('스텔라', '뉴브의원'),
+    ('케이블린', '케이블린필러'),
+    ('쥬브겔', '쥬브겔필러'),
+)
+# find_column_mappings의 헤더 키워드를 우선순위 순으로 한 번의 스캔에서 모두 찾음
+# (lookahead라 겹치는 키워드도 위치마다 가장 우선인 분류가 잡힘)
+_HEADER_KEYWORDS = (
+    ('name', ('성함', '이름', '신청자', '고객명', '환자명')),
+    ('phone', ('연락처', '전화', '핸드폰', '휴대폰')),
+    ('confirmed_date', ('확정일시', '예약확정일시', '수술일', '시술일')),
+    ('date', ('예약일시', '날짜', '일시')),
+    ('procedure', ('시술', '수술', '부위', '진행', '항목')),
+)
+_HEADER_KEYWORD_RE = re.compile(
+    '(?=' + '|'.join(f"(?P<{category}>{'|'.join(keywords)})" for category, keywords in _HEADER_KEYWORDS) + ')'
+)
+_PLACEHOLDER_VALUES = frozenset(('', '-', 'N/A'))
+_HANGUL_NAME_RE = re.compile('[가-힣]{2,4}')  # 한글 2~4자 이름 (패턴 기반 이름 컬럼 찾기)
+_COLUMN_DATA_WINDOW = 20  # 헤더 아래 몇 행 안에 데이터가 있어야 컬럼으로 인정하는지
+_COLUMN_MAPPING_ROWS = 15 + _COLUMN_DATA_WINDOW  # find_column_mappings가 읽는 앞쪽 행 수
+
+# Single anchored equivalent of the strptime formats "%y/%Y-%m-%d[(%a)] %H:%M" (same field ranges as _strptime)
+_DATETIME_RE = re.compile(
+    r'(\d\d|\d{4})-(1[0-2]|0[1-9]|[1-9])-(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])'
+    r'(?:(?:\((?:mon|tue|wed|thu|fri|sat|sun)\))?\s+(2[0-3]|[01]\d|\d):([0-5]\d|\d))?',
+    re.IGNORECASE
+)
+# 날짜 뒤에 요일 "(목)"과 "오전/오후"가 붙은 시간도 받음
+_DATE_FALLBACK_RE = re.compile(
+    r'(\d{2,4})[-/.](\d{1,2})[-/.](\d{1,2})'
+    r'(?:\s*(?:\([^)]{1,3}\))?\s*(오전|오후|am|pm)?\s*(\d{1,2}):(\d{2}))?',
+    re.IGNORECASE
+)
 
 def clean_json_string(json_str: str) -> str:
     """Remove control characters from JSON string"""
-    cleaned = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', json_str)
-    return cleaned
+    return json_str.translate(_CONTROL_CHARS_TABLE)
+
+def _load_credentials_json(content: str) -> dict:
+    """Parse the OAuth JSON, scrubbing control characters only if it does not parse as-is"""
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return orjson.loads(clean_json_string(content))
+
+# 파싱한 OAuth 클라이언트 설정 (환경 변수/파일은 실행 중 바뀌지 않으므로 한 번만 읽음)
+_credentials_info: Optional[dict] = None
 
 def get_google_credentials_info():
     """Get Google OAuth credentials from environment variable or file"""
-    try:
-        env_creds = os.getenv('GOOGLE_CREDENTIALS_JSON')
-        
-        if env_creds:
-            cleaned_creds = clean_json_string(env_creds)
-            return json.loads(cleaned_creds)
-        
-        if os.path.exists("credentials.json"):
-            with open("credentials.json", 'r', encoding='utf-8') as f:
-                content = f.read()
-                cleaned_content = clean_json_string(content)
-                return json.loads(cleaned_content)
-        
-        raise Exception("OAuth 설정이 없습니다.")
-    except Exception as e:
-        raise e
+    global _credentials_info
+    if _credentials_info is not None:
+        return _credentials_info
+    
+    env_creds = os.getenv('GOOGLE_CREDENTIALS_JSON')
+    
+    if env_creds:
+        _credentials_info = _load_credentials_json(env_creds)
+        return _credentials_info
+    
+    if os.path.exists("credentials.json"):
+        with open("credentials.json", 'r', encoding='utf-8') as f:
+            _credentials_info = _load_credentials_json(f.read())
+        return _credentials_info
+    
+    raise Exception("OAuth 설정이 없습니다.")
 
 def get_redirect_uri(request: Request):
     """Get the appropriate redirect URI based on the request"""
     base_url = str(request.base_url).rstrip('/')
     return f"{base_url}/auth/callback"
 
-def get_google_client():
-    """Initialize Google Sheets client with user credentials"""
-    global user_credentials
-    if not user_credentials:
+def create_oauth_flow(request: Request) -> Flow:
+    """OAuth flow for this request's redirect URI.
+    
+    Built per request: fetch_token() stores the user's token on the flow, so one shared per
+    redirect URI would mix up concurrent logins. The client config itself is parsed only once.
+    """
+    return Flow.from_client_config(
+        get_google_credentials_info(),
+        scopes=SCOPES,
+        redirect_uri=get_redirect_uri(request)
+    )
+
+def get_session_id(request: Request) -> Optional[str]:
+    """Login session id of the request, None if not logged in"""
+    session_id = request.session.get("session_id")
+    if session_id and get_user_credentials(session_id) is not None:
+        return session_id
+    return None
+
+# 토큰이 한 번도 갱신되지 않은 채 이만큼 지난 세션은 로그인할 때 정리
+_SESSION_MAX_IDLE_DAYS = 30
+
+def _session_client(session_id: str) -> Optional[tuple]:
+    """(credentials, gspread client) of a login session, loaded from SQLite on a cache miss"""
+    with _google_cache_lock:
+        cached = _session_clients.get(session_id)
+        if cached is not None:
+            _session_clients.move_to_end(session_id)
+            return cached
+    
+    credentials_json = get_session_credentials(session_id)
+    if credentials_json is None:
+        return None
+    credentials = Credentials.from_authorized_user_info(json.loads(credentials_json), SCOPES)
+    # 한 요청에서 클라이언트까지 만들어 두고, 다음 요청부터는 같은 객체(갱신된 토큰 포함)를 재사용
+    with _google_cache_lock:
+        cached = _session_clients.setdefault(session_id, (credentials, gspread.authorize(credentials)))
+        while len(_session_clients) > _SESSION_CLIENT_CACHE_SIZE:
+            _session_clients.popitem(last=False)
+    return cached
+
+def get_user_credentials(session_id: str) -> Optional[Credentials]:
+    """Credentials of a login session, None if the session is unknown"""
+    cached = _session_client(session_id)
+    return cached[0] if cached is not None else None
+
+def get_google_client(session_id: str):
+    """Initialize Google Sheets client with the session's credentials"""
+    cached = _session_client(session_id)
+    if cached is None:
         raise HTTPException(status_code=401, detail="Google 로그인이 필요합니다.")
+    return cached[1]
+
+def credentials_to_json(credentials: Credentials) -> str:
+    """Serialize credentials for user_sessions so from_authorized_user_info can load them back"""
+    info = json.loads(credentials.to_json())
+    # to_json()은 None 값을 빼지만, 재로그인 시 refresh_token이 없을 수 있어 키는 남겨 둠
+    info.setdefault("refresh_token", None)
+    return json.dumps(info)
+
+def store_refreshed_credentials(session_id: str, token_before: Optional[str]):
+    """google-auth refreshes an expired access token in place; keep the new one in SQLite"""
+    credentials = get_user_credentials(session_id)
+    if credentials is not None and credentials.token != token_before:
+        save_session_credentials(session_id, credentials_to_json(credentials))
+
+def clear_google_caches(session_id: str):
+    """Forget the session's cached client and spreadsheets (login/logout)"""
+    with _google_cache_lock:
+        _session_clients.pop(session_id, None)
+        for cache in (_spreadsheet_cache, _sheet_data_cache):
+            for key in [key for key in cache if key[0] == session_id]:
+                del cache[key]
+
+def get_worksheet_title(session_id: str, sheet_id: str, gid: str) -> str:
+    """Worksheet title for a gid (first worksheet if the gid is unknown), looked up at most once per TTL"""
+    now = time.monotonic()
+    with _google_cache_lock:
+        cached = _spreadsheet_cache.get((session_id, sheet_id))
+    
+    if cached is None or cached[0] <= now:
+        # open_by_key() + worksheets()는 메타데이터를 두 번 받으므로, 필요한 필드만 한 번에 요청
+        metadata = get_google_client(session_id).request(
+            "get", SPREADSHEET_URL % sheet_id, params={"fields": "sheets.properties(sheetId,title)"}
+        ).json()
+        properties = [ws["properties"] for ws in metadata["sheets"]]
+        titles_by_gid = {str(props["sheetId"]): props["title"] for props in properties}
+        cached = (now + _SPREADSHEET_CACHE_TTL, titles_by_gid, properties[0]["title"])
+        with _google_cache_lock:
+            _spreadsheet_cache[(session_id, sheet_id)] = cached
     
-    return gspread.authorize(user_credentials)
+    _, titles_by_gid, first = cached
+    return titles_by_gid.get(gid) or first
+
+def get_spreadsheet_modified_time(session_id: str, sheet_id: str) -> str:
+    """Drive modifiedTime of a spreadsheet (changes on any edit to any of its worksheets)"""
+    client = get_google_client(session_id)
+    token_before = client.auth.token
+    with _google_fetch_slots:
+        metadata = client.request(
+            "get", f"{DRIVE_FILES_API_V3_URL}/{sheet_id}",
+            params={"fields": "modifiedTime", "supportsAllDrives": True}
+        ).json()
+    store_refreshed_credentials(session_id, token_before)
+    return metadata["modifiedTime"]
 
 # Data models
 class SheetConfig(BaseModel):
@@ -77,10 +315,11 @@ class SheetConfig(BaseModel):
     url: str
     color: str
 
+@lru_cache(maxsize=512)
 def extract_sheet_id_and_gid(url: str) -> tuple:
     """Extract sheet ID and GID from Google Sheets URL"""
-    sheet_id_match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', url)
-    gid_match = re.search(r'[#&]gid=([0-9]+)', url)
+    sheet_id_match = _SHEET_ID_RE.search(url)
+    gid_match = _GID_RE.search(url)
     
     if not sheet_id_match:
         raise ValueError("유효하지 않은 Google Sheets URL입니다")
@@ -90,59 +329,112 @@ def extract_sheet_id_and_gid(url: str) -> tuple:
     
     return sheet_id, gid
 
-def fetch_sheet_data(sheet_id: str, gid: str = "0") -> List[Dict]:
-    """Fetch data from Google Sheets using authenticated access"""
+def fetch_sheet_data(session_id: str, sheet_id: str, gid: str = "0", use_cache: bool = True) -> List[Dict]:
+    """Fetch data from Google Sheets using authenticated access (served from a short TTL cache unless use_cache=False)"""
     try:
-        print(f"Fetching sheet data for ID: {sheet_id}, GID: {gid}")
-        client = get_google_client()
-        
-        spreadsheet = client.open_by_key(sheet_id)
-        
-        # Get worksheet by GID
-        worksheets = spreadsheet.worksheets()
-        worksheet = None
-        for ws in worksheets:
-            if str(ws.id) == gid:
-                worksheet = ws
-                break
-        
-        if not worksheet:
-            worksheet = spreadsheet.sheet1
+        return fetch_sheets_data(session_id, sheet_id, [gid], use_cache)[gid]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"시트 데이터 가져오기 실패: {str(e)}")
+
+def fetch_sheets_data(session_id: str, sheet_id: str, gids: List[str], use_cache: bool = True) -> Dict[str, List[Dict]]:
+    """Records for several worksheets (gids) of one spreadsheet, fetching the uncached ones in a single values:batchGet"""
+    results = {}
+    missing = []
+    now = time.monotonic()
+    for gid in dict.fromkeys(gids):
+        with _google_cache_lock:
+            cached = _sheet_data_cache.get((session_id, sheet_id, gid)) if use_cache else None
+        if cached is not None and cached[0] > now:
+            results[gid] = cached[1]
+        else:
+            missing.append(gid)
+    
+    if not missing:
+        return results
+    
+    logger.info("Fetching sheet data for ID: %s, GIDs: %s", sheet_id, ", ".join(missing))
+    client = get_google_client(session_id)
+    token_before = client.auth.token
+    
+    with _google_fetch_slots:
+        # Get worksheet titles by GID (알 수 없는 gid는 첫 시트로 가므로 같은 범위는 한 번만 요청)
+        titles = {gid: get_worksheet_title(session_id, sheet_id, gid) for gid in missing}
+        ranges = list(dict.fromkeys(titles.values()))
         
-        # Try to get all records
-        try:
-            records = worksheet.get_all_records()
-            print(f"Got {len(records)} records")
-        except Exception:
-            records = []
+        # One values request for all ranges; the header-keyed records are derived from it locally
+        response = client.request(
+            "get", SPREADSHEET_VALUES_BATCH_URL % sheet_id,
+            params={"ranges": [absolute_range_name(title) for title in ranges]}
+        ).json()
+    store_refreshed_credentials(session_id, token_before)
+    values_by_title = {
+        title: value_range.get("values", [])
+        for title, value_range in zip(ranges, response.get("valueRanges", []))
+    }
+    
+    for gid in missing:
+        # worksheet.get_all_values()와 같은 직사각형 격자
+        all_values = fill_gaps(values_by_title.get(titles[gid], []))
+        records = records_from_values(all_values)
+        if records:
+            logger.info("Got %s records", len(records))
         
-        # If no records, get raw values
+        # If no records, use raw values (빈 시트는 None이 아니라 빈 리스트로 캐시/반환)
         if not records:
-            all_values = worksheet.get_all_values()
+            records = []
             if all_values:
-                max_columns = max(len(row) for row in all_values) if all_values else 0
-                headers = [chr(65 + i) if i < 26 else f"Column_{i+1}" for i in range(max_columns)]
+                # fill_gaps already padded every row to the widest one, so the first row's
+                # length is the width and every cell maps by position
+                headers = column_headers(len(all_values[0]))
                 
-                records = []
-                for row in all_values:
-                    record = {}
-                    for i, value in enumerate(row):
-                        if i < len(headers):
-                            record[headers[i]] = value
-                        else:
-                            record[f"Column_{i+1}"] = value
-                    records.append(record)
-        
-        return records
+                records = [dict(zip(headers, row)) for row in all_values]
         
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"시트 데이터 가져오기 실패: {str(e)}")
+        with _google_cache_lock:
+            _sheet_data_cache[(session_id, sheet_id, gid)] = (time.monotonic() + _SHEET_DATA_CACHE_TTL, records)
+        results[gid] = records
+    
+    return results
+
+def _trim_row(row: List[str]) -> List[str]:
+    """Drop trailing empty cells (the Sheets API omits them)"""
+    end = len(row)
+    while end and row[end - 1] == '':
+        end -= 1
+    return row[:end]
+
+def records_from_values(all_values: List[List[str]]) -> Optional[List[Dict]]:
+    """Same records worksheet.get_all_records() would return, built from an already fetched values grid.
+    
+    None where get_all_records() would fail (empty header row or body, duplicate headers,
+    more than one unnamed column), so the caller falls back to column-letter keys.
+    """
+    keys = _trim_row(all_values[0]) if all_values else []
+    body = [_trim_row(row) for row in all_values[1:]]
+    if not keys or not body or len(keys) != len(set(keys)):
+        return None
+    
+    extra_columns = max(len(row) for row in body) - len(keys)
+    if extra_columns > 1 or (extra_columns == 1 and '' in keys):
+        return None
+    if extra_columns == 1:
+        keys.append('')
+    
+    width = len(keys)
+    return [dict(zip(keys, numericise_all(row + [''] * (width - len(row))))) for row in body]
+
+@lru_cache(maxsize=64)
+def column_headers(width: int) -> tuple:
+    """Column keys for a raw values grid: A..Z, then Column_27, Column_28, ..."""
+    return tuple(chr(65 + i) if i < 26 else f"Column_{i+1}" for i in range(width))
 
 def find_column_mappings(data: List[Dict]) -> Dict[str, str]:
     """데이터에서 동적으로 컬럼 매핑을 찾는 함수"""
     mappings = {'name': None, 'phone': None, 'date': None, 'procedure': None}
     
-    print(f"Analyzing {len(data)} rows for column mappings...")
+    logger.info("Analyzing %s rows for column mappings...", len(data))
+    
+    # 헤더 후보(앞 15행)마다 아래 행들을 다시 훑지 않도록 컬럼별 데이터 행을 한 번에 모음
+    data_rows = column_data_rows(data[:_COLUMN_MAPPING_ROWS])
     
     for row_idx, row in enumerate(data[:15]):
         if not row:
@@ -153,55 +445,57 @@ def find_column_mappings(data: List[Dict]) -> Dict[str, str]:
                 continue
                 
             value_str = str(value).lower().strip()
+            categories = {match.lastgroup for match in _HEADER_KEYWORD_RE.finditer(value_str)}
+            if not categories:
+                continue
             
             # 이름 컬럼 찾기
-            if any(keyword in value_str for keyword in ['성함', '이름', '신청자', '고객명', '환자명']):
-                if check_column_has_data(data, key, row_idx + 1):
-                    print(f"Found name column: {key}")
+            if 'name' in categories:
+                if check_column_has_data(data_rows, key, row_idx + 1):
+                    logger.debug("Found name column: %s", key)
                     mappings['name'] = key
             
             # 전화번호 컬럼 찾기
-            elif any(keyword in value_str for keyword in ['연락처', '전화', '핸드폰', '휴대폰']):
-                if check_column_has_data(data, key, row_idx + 1):
-                    print(f"Found phone column: {key}")
+            elif 'phone' in categories:
+                if check_column_has_data(data_rows, key, row_idx + 1):
+                    logger.debug("Found phone column: %s", key)
                     mappings['phone'] = key
             
             # 날짜 컬럼 찾기
-            elif any(keyword in value_str for keyword in ['확정일시', '예약확정일시', '수술일', '시술일']):
-                if check_column_has_data(data, key, row_idx + 1):
-                    print(f"Found date column: {key}")
+            elif 'confirmed_date' in categories:
+                if check_column_has_data(data_rows, key, row_idx + 1):
+                    logger.debug("Found date column: %s", key)
                     mappings['date'] = key
-            elif not mappings['date'] and any(keyword in value_str for keyword in ['예약일시', '날짜', '일시']):
-                if check_column_has_data(data, key, row_idx + 1):
-                    print(f"Found general date column: {key}")
+            elif not mappings['date'] and 'date' in categories:
+                if check_column_has_data(data_rows, key, row_idx + 1):
+                    logger.debug("Found general date column: %s", key)
                     mappings['date'] = key
             
             # 시술 정보 컬럼 찾기
-            elif any(keyword in value_str for keyword in ['시술', '수술', '부위', '진행', '항목']):
-                if check_column_has_data(data, key, row_idx + 1):
-                    print(f"Found procedure column: {key}")
+            elif 'procedure' in categories:
+                if check_column_has_data(data_rows, key, row_idx + 1):
+                    logger.debug("Found procedure column: %s", key)
                     mappings['procedure'] = key
     
     # 패턴 기반 이름 찾기
     if not mappings['name']:
-        print("Trying pattern-based name detection...")
+        logger.debug("Trying pattern-based name detection...")
+        # 컬럼별 이름 모양 셀 개수의 누적합을 한 번씩만 만들어, 아래 10행 개수를 빼기 한 번으로 구함
+        window_rows = data[:20 + 9]
+        name_prefix: Dict[str, List[int]] = {}
         for row_idx, row in enumerate(data[:20]):
             for key, value in row.items():
                 if not value:
                     continue
                 value_str = str(value).strip()
-                if (len(value_str) >= 2 and len(value_str) <= 4 and 
-                    all('가' <= c <= '힣' for c in value_str)):
-                    name_count = 0
-                    for check_row in data[row_idx:row_idx + 10]:
-                        if key in check_row and check_row[key]:
-                            check_value = str(check_row[key]).strip()
-                            if (len(check_value) >= 2 and len(check_value) <= 4 and 
-                                all('가' <= c <= '힣' for c in check_value)):
-                                name_count += 1
+                if _HANGUL_NAME_RE.fullmatch(value_str):
+                    prefix = name_prefix.get(key)
+                    if prefix is None:
+                        prefix = name_prefix[key] = hangul_name_prefix(window_rows, key)
+                    name_count = prefix[min(row_idx + 10, len(window_rows))] - prefix[row_idx]
                     
                     if name_count >= 3:
-                        print(f"Found name column by pattern: {key}")
+                        logger.debug("Found name column by pattern: %s", key)
                         mappings['name'] = key
                         break
             if mappings['name']:
@@ -209,23 +503,43 @@ def find_column_mappings(data: List[Dict]) -> Dict[str, str]:
     
     return mappings
 
-def check_column_has_data(data: List[Dict], column_key: str, start_row: int = 1) -> bool:
-    """해당 컬럼에 실제 데이터가 있는지 확인"""
-    data_count = 0
-    check_limit = min(start_row + 20, len(data))
+def cached_column_mappings(db_sheet_id: int, data: List[Dict]) -> Dict[str, str]:
+    """find_column_mappings, reused while the sheet's leading rows stay the same"""
+    head = data[:_COLUMN_MAPPING_ROWS]
+    cached = _column_mappings_cache.get(db_sheet_id)
+    if cached is not None and cached[0] == head:
+        return cached[1]
     
-    for i in range(start_row, check_limit):
-        if i >= len(data):
-            break
-        row = data[i]
-        if column_key in row and row[column_key]:
-            value = str(row[column_key]).strip()
-            if value and value not in ['', '-', 'N/A']:
-                data_count += 1
-                if data_count >= 3:
-                    return True
-    
-    return data_count >= 1
+    mappings = find_column_mappings(data)
+    _column_mappings_cache[db_sheet_id] = (head, mappings)
+    return mappings
+
+def hangul_name_prefix(rows: List[Dict], column_key: str) -> List[int]:
+    """prefix[i] = rows[:i] 중 column_key 값이 한글 2~4자 이름인 행 수"""
+    prefix = [0]
+    for row in rows:
+        value = row.get(column_key)
+        prefix.append(prefix[-1] + (1 if value and _HANGUL_NAME_RE.fullmatch(str(value).strip()) else 0))
+    return prefix
+
+def column_data_rows(data: List[Dict]) -> Dict[str, List[int]]:
+    """컬럼별로 실제 데이터('', '-', 'N/A'가 아닌 값)가 있는 행 번호 (오름차순)"""
+    data_rows: Dict[str, List[int]] = {}
+    for i, row in enumerate(data):
+        for key, value in row.items():
+            if not value:
+                continue
+            # 셀 값은 대부분 이미 str이므로 str() 호출은 숫자 셀에만
+            text = value if type(value) is str else str(value)
+            if text.strip() not in _PLACEHOLDER_VALUES:
+                data_rows.setdefault(key, []).append(i)
+    return data_rows
+
+def check_column_has_data(data_rows: Dict[str, List[int]], column_key: str, start_row: int = 1) -> bool:
+    """해당 컬럼에 실제 데이터가 있는지 확인 (start_row부터 20행 안에 한 개 이상)"""
+    rows = data_rows.get(column_key, [])
+    i = bisect.bisect_left(rows, start_row)
+    return i < len(rows) and rows[i] < start_row + _COLUMN_DATA_WINDOW
 
 def extract_hospital_from_data(sheet_name: str, data: List[Dict]) -> str:
     """시트에서 병원명 추출"""
@@ -240,42 +554,31 @@ def extract_hospital_from_data(sheet_name: str, data: List[Dict]) -> str:
                         prev_value = str(prev_value).strip()
                         prev_value_lower = prev_value.lower()
                         
-                        print(f"Found hospital candidate from 개인정보: '{prev_value}'")
+                        logger.debug("Found hospital candidate from 개인정보: '%s'", prev_value)
                         
                         # 스텔라/뉴브 관련 패턴 검사
-                        if any(pattern in prev_value_lower for pattern in ['스텔라엠투투', '스텔라', '뉴브', '엠투투', 'm2m']):
-                            print(f"Matched Stella/Newb pattern in sheet header: '{prev_value}' -> '뉴브의원'")
+                        if _STELLA_RE.search(prev_value_lower):
+                            logger.debug("Matched Stella/Newb pattern in sheet header: '%s' -> '뉴브의원'", prev_value)
                             return '뉴브의원'
                         
                         # 제네오엑스/셀나인 관련 패턴 검사
-                        elif any(pattern in prev_value_lower for pattern in ['제네오엑스', '셀나인']):
-                            print(f"Matched GeneoX/Cellnine pattern in sheet header: '{prev_value}' -> '셀나인청담'")
+                        elif _GENEOEX_RE.search(prev_value_lower):
+                            logger.debug("Matched GeneoX/Cellnine pattern in sheet header: '%s' -> '셀나인청담'", prev_value)
                             return '셀나인청담'
                         
                         # 일반 병원 키워드
-                        elif (any(keyword in prev_value_lower for keyword in ['병원', '의원', '피부과', '외과']) 
+                        elif (_HOSPITAL_SUFFIX_RE.search(prev_value_lower)
                               or ('-' in prev_value and len(prev_value) > 5)):
-                            print(f"Found hospital from '개인정보': {prev_value}")
+                            logger.debug("Found hospital from '개인정보': %s", prev_value)
                             return prev_value
     
     # 시트명에서 병원명 추출 (더 상세한 매핑)
     sheet_name_lower = sheet_name.lower()
-    print(f"Checking sheet name: '{sheet_name}'")
-    
-    patterns = {
-        '라비앙': '라비앙성형외과',
-        '트랜드': '트랜드성형외과', 
-        '황금': '황금피부과',
-        '셀나인': '셀나인청담',
-        '제네오엑스': '뉴브의원',
-        '스텔라': '뉴브의원',
-        '케이블린': '케이블린필러',
-        '쥬브겔': '쥬브겔필러'
-    }
+    logger.debug("Checking sheet name: '%s'", sheet_name)
     
-    for pattern, hospital in patterns.items():
+    for pattern, hospital in _SHEET_NAME_HOSPITALS:
         if pattern in sheet_name_lower:
-            print(f"Matched sheet name pattern '{pattern}' -> '{hospital}'")
+            logger.debug("Matched sheet name pattern '%s' -> '%s'", pattern, hospital)
             return hospital
     
     return ""
@@ -285,24 +588,35 @@ def extract_phone_number(text) -> str:
     if not text:
         return ""
     
+    # 010 번호는 일반 패턴에도 걸리므로 일반 패턴 한 번으로 번호가 없는 셀을 거르고,
+    # 있으면 그 위치부터 010 번호를 우선 (앞쪽에 010 번호가 있을 수는 없음)
     text = str(text)
-    patterns = [r'010-\d{4}-\d{4}', r'\d{3}-\d{3,4}-\d{4}']
-    
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group()
+    # 모든 패턴에 하이픈이 들어가므로 하이픈이 없으면 정규식 없이 바로 거름
+    if '-' not in text:
+        return ""
+    match = _PHONE_PATTERNS[1].search(text)
+    if not match:
+        return ""
     
-    return ""
+    preferred = _PHONE_PATTERNS[0].search(text, match.start())
+    return (preferred or match).group()
 
 def find_phone_in_row(row_dict: Dict) -> str:
     """행에서 전화번호 찾기"""
-    for key, value in row_dict.items():
-        if value:
-            phone = extract_phone_number(value)
-            if phone:
-                return phone
-    return ""
+    # 셀을 \x01(숫자/하이픈이 아님)로 이어붙여 정규식 한 번으로 전화번호가 있는 첫 셀을 찾음
+    joined = '\x01'.join(str(value) for value in row_dict.values() if value)
+    if '-' not in joined:
+        return ""
+    match = _PHONE_PATTERNS[1].search(joined)
+    if not match:
+        return ""
+    
+    # 그 셀 안에서는 010 번호를 우선 (extract_phone_number와 같은 순서)
+    start = joined.rfind('\x01', 0, match.start()) + 1
+    end = joined.find('\x01', match.end())
+    cell = joined[start:end] if end != -1 else joined[start:]
+    preferred = _PHONE_PATTERNS[0].search(cell)
+    return (preferred or match).group()
 
 def parse_date_time(date_str: str) -> tuple:
     """날짜 문자열 파싱"""
@@ -311,35 +625,45 @@ def parse_date_time(date_str: str) -> tuple:
     
     date_str = str(date_str).strip()
     
-    formats = [
-        "%y-%m-%d(%a) %H:%M", "%Y-%m-%d(%a) %H:%M",
-        "%y-%m-%d %H:%M", "%Y-%m-%d %H:%M",
-        "%y-%m-%d", "%Y-%m-%d"
-    ]
-    
-    for fmt in formats:
+    # 정규식 한 번으로 날짜/시간 분리 (형식별 strptime 시도와 예외 처리 반복을 피함)
+    match = _DATETIME_RE.fullmatch(date_str)
+    if match:
+        year_str, month, day, hour, minute = match.groups()
+        year = int(year_str)
+        if len(year_str) == 2:
+            year += 2000 if year <= 68 else 1900  # strptime %y 규칙
+        
         try:
-            dt = datetime.strptime(date_str, fmt)
-            time_part = dt.strftime("%H:%M") if "%H" in fmt else "09:00"
-            return dt.strftime("%Y-%m-%d"), time_part
+            date(year, int(month), int(day))
         except ValueError:
-            continue
+            pass
+        else:
+            time_part = f"{int(hour):02d}:{int(minute):02d}" if hour else "09:00"
+            return f"{year}-{int(month):02d}-{int(day):02d}", time_part
     
     # 정규표현식 파싱
-    match = re.search(r'(\d{2,4})[-/.](\d{1,2})[-/.](\d{1,2})(?:\s*(\d{1,2}):(\d{2}))?', date_str)
+    match = _DATE_FALLBACK_RE.search(date_str)
     if match:
-        year, month, day, hour, minute = match.groups()
+        year, month, day, meridiem, hour, minute = match.groups()
         
         if len(year) == 2:
             year = "20" + year if int(year) < 50 else "19" + year
         
+        # 정수로 바로 검증 (세 자리 연도는 "%Y-%m-%d"의 strptime처럼 거절)
         try:
-            date_formatted = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            datetime.strptime(date_formatted, "%Y-%m-%d")
-            time_formatted = f"{hour.zfill(2)}:{minute}" if hour and minute else "09:00"
-            return date_formatted, time_formatted
+            if len(year) != 4:
+                raise ValueError(year)
+            date(int(year), int(month), int(day))
         except ValueError:
             pass
+        else:
+            date_formatted = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+            if hour and minute and meridiem:
+                hour_value = int(hour) % 12 + (12 if meridiem.lower() in ('오후', 'pm') else 0)
+                time_formatted = f"{hour_value:02d}:{minute}"
+            else:
+                time_formatted = f"{hour.zfill(2)}:{minute}" if hour and minute else "09:00"
+            return date_formatted, time_formatted
     
     return None, None
 
@@ -378,109 +702,104 @@ def extract_meaningful_data(row_dict: Dict, column_mappings: Dict[str, str]) ->
     
     return result
 
-def find_hospital_near_name(all_data: List[Dict], current_row_idx: int, name_value: str) -> str:
-    """이름 주변에서 가장 가까운 '개인정보' 바로 위에서 병원 정보 찾기"""
-    print(f"Looking for hospital info near {name_value} at row {current_row_idx}")
-    
-    # 이름이 있는 행에서 위로 50개 행까지 검사
-    start_row = max(0, current_row_idx - 50)
-    
-    # 가장 가까운 '개인정보' 찾기
-    closest_info_row = None
-    closest_distance = float('inf')
-    
-    for i in range(current_row_idx, start_row - 1, -1):
-        if i >= len(all_data):
+def _backup_hospital_in_row(row: Dict) -> str:
+    """백업 검색 기준으로 행에서 처음 발견되는 병원 정보 (없으면 빈 문자열)"""
+    for key, value in row.items():
+        if not value:
             continue
-            
-        row = all_data[i]
-        if not row:
-            continue
-            
-        for key, value in row.items():
-            if value and isinstance(value, str) and '개인정보' in value:
-                distance = current_row_idx - i
-                if distance < closest_distance:
-                    closest_distance = distance
-                    closest_info_row = i
-                    print(f"Found '개인정보' at row {i}, distance: {distance}")
-                break
-    
-    # 가장 가까운 '개인정보' 바로 위에서 병원 정보 찾기
-    if closest_info_row is not None and closest_info_row > 0:
-        prev_row = all_data[closest_info_row - 1]
-        print(f"Checking row {closest_info_row - 1} above '개인정보'")
+        value_str = str(value).strip().lower()
         
-        for prev_key, prev_value in prev_row.items():
-            if prev_value and isinstance(prev_value, str):
-                prev_value = str(prev_value).strip()
-                print(f"Checking hospital value: '{prev_value}'")
-                
-                # 더 정확한 병원명 매핑 (대소문자 구분 없이)
-                prev_value_lower = prev_value.lower()
-                
-                # 스텔라엠투투_뉴브의원 관련 패턴들
-                stella_patterns = ['스텔라엠투투_뉴브의원', '스텔라엠투투', '스텔라', '뉴브의원', '뉴브', '엠투투', 'm2m']
-                
-                for pattern in stella_patterns:
-                    if pattern in prev_value_lower:
-                        print(f"Found Stella/Newb pattern '{pattern}' for {name_value}: '뉴브의원'")
-                        return '뉴브의원'
-                
-                # 제네오엑스_셀나인청담 관련 패턴들
-                geneoex_patterns = ['제네오엑스_셀나인청담', '제네오엑스', '셀나인청담', '셀나인']
-                
-                for pattern in geneoex_patterns:
-                    if pattern in prev_value_lower:
-                        print(f"Found GeneoX/Cellnine pattern '{pattern}' for {name_value}: '셀나인청담'")
-                        return '셀나인청담'
-                
-                # 일반 병원 키워드
-                if any(keyword in prev_value_lower for keyword in ['병원', '의원', '피부과', '외과', '클리닉', '센터']):
-                    print(f"Found general hospital keyword for {name_value}: '{prev_value}'")
-                    return prev_value
-                elif '-' in prev_value and len(prev_value) > 10:
-                    print(f"Found dash-separated hospital info for {name_value}: '{prev_value}'")
-                    return prev_value
-    
-    # 백업: 이름 주변에서 병원 키워드 찾기
-    print(f"Backup search around row {current_row_idx}")
-    for i in range(max(0, current_row_idx - 10), min(current_row_idx + 3, len(all_data))):
-        row = all_data[i]
-        if not row:
-            continue
+        # 더 많은 패턴 검사
+        if _STELLA_RE.search(value_str):
+            return '뉴브의원'
+        elif _GENEOEX_RE.search(value_str):
+            return '셀나인청담'
+        elif (_HOSPITAL_KEYWORD_RE.search(value_str)
+              and len(value_str) < 100 and len(value_str) > 5):
+            return str(value).strip()
+    return ""
+
+def _hospital_above_info(prev_row: Dict) -> str:
+    """'개인정보' 바로 위 행에서 병원 정보 찾기 (없으면 빈 문자열)"""
+    for prev_key, prev_value in prev_row.items():
+        if prev_value and isinstance(prev_value, str):
+            prev_value = str(prev_value).strip()
             
-        for key, value in row.items():
-            if not value:
-                continue
-            value_str = str(value).strip().lower()
+            # 더 정확한 병원명 매핑 (대소문자 구분 없이)
+            prev_value_lower = prev_value.lower()
             
-            # 더 많은 패턴 검사
-            if any(pattern in value_str for pattern in ['스텔라', '뉴브', '엠투투', 'm2m']):
-                print(f"Found Stella/Newb in backup search: '{value}'")
+            # 스텔라엠투투_뉴브의원 관련 패턴들
+            if _STELLA_RE.search(prev_value_lower):
                 return '뉴브의원'
-            elif any(pattern in value_str for pattern in ['제네오엑스', '셀나인']):
-                print(f"Found GeneoX/Cellnine in backup search: '{value}'")
+            
+            # 제네오엑스_셀나인청담 관련 패턴들
+            if _GENEOEX_RE.search(prev_value_lower):
                 return '셀나인청담'
-            elif (any(keyword in value_str for keyword in ['병원', '의원', '피부과', '외과', '클리닉', '센터']) 
-                  and len(value_str) < 100 and len(value_str) > 5):
-                print(f"Found hospital info in backup search: '{value}'")
-                return str(value).strip()
+            
+            # 일반 병원 키워드
+            if _HOSPITAL_KEYWORD_RE.search(prev_value_lower):
+                return prev_value
+            elif '-' in prev_value and len(prev_value) > 10:
+                return prev_value
+    return ""
+
+def build_hospital_row_index(all_data: List[Dict]) -> tuple:
+    """시트를 한 번 훑어서 이름별 병원 검색에 쓰는 두 인덱스를 만듦
+    
+    - '개인정보'가 있는 행 번호(오름차순)와 각 행 바로 위에서 찾은 병원 정보
+    - 백업 검색에 걸리는 행 번호(오름차순)와 병원 정보
+    """
+    info_rows, info_hospitals = [], []
+    hospital_rows, hospital_values = [], []
+    for i, row in enumerate(all_data):
+        if not row:
+            continue
+        if any(value and isinstance(value, str) and '개인정보' in value for value in row.values()):
+            info_rows.append(i)
+            info_hospitals.append(_hospital_above_info(all_data[i - 1]) if i > 0 else "")
+        hospital = _backup_hospital_in_row(row)
+        if hospital:
+            hospital_rows.append(i)
+            hospital_values.append(hospital)
+    return info_rows, info_hospitals, hospital_rows, hospital_values
+
+def find_hospital_near_name(all_data: List[Dict], current_row_idx: int, name_value: str,
+                            hospital_index: tuple = None) -> str:
+    """이름 주변에서 가장 가까운 '개인정보' 바로 위에서 병원 정보 찾기"""
+    logger.debug("Looking for hospital info near %s at row %s", name_value, current_row_idx)
+    if hospital_index is None:
+        hospital_index = build_hospital_row_index(all_data)
+    info_rows, info_hospitals, hospital_rows, hospital_values = hospital_index
     
-    print(f"No hospital info found for {name_value}")
+    # 이름이 있는 행에서 위로 50개 행 안의 가장 가까운 '개인정보' (이진 검색)
+    pos = bisect.bisect_right(info_rows, current_row_idx) - 1
+    if pos >= 0 and info_rows[pos] >= current_row_idx - 50:
+        logger.debug("Found '개인정보' at row %s, distance: %s", info_rows[pos], current_row_idx - info_rows[pos])
+        
+        # 가장 가까운 '개인정보' 바로 위에서 찾은 병원 정보
+        if info_hospitals[pos]:
+            logger.debug("Found hospital above '개인정보' for %s: '%s'", name_value, info_hospitals[pos])
+            return info_hospitals[pos]
+    
+    # 백업: 이름 주변(위 10행 ~ 아래 2행)에서 병원 키워드가 처음 나오는 행을 인덱스에서 이진 검색
+    logger.debug("Backup search around row %s", current_row_idx)
+    pos = bisect.bisect_left(hospital_rows, max(0, current_row_idx - 10))
+    if pos < len(hospital_rows) and hospital_rows[pos] < min(current_row_idx + 3, len(all_data)):
+        logger.debug("Found hospital info in backup search: '%s'", hospital_values[pos])
+        return hospital_values[pos]
+    
+    logger.debug("No hospital info found for %s", name_value)
     return ""
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    global user_credentials
-    is_authenticated = user_credentials is not None
+    session_id = get_session_id(request)
+    is_authenticated = session_id is not None
     
     if is_authenticated:
-        try:
-            print("Auto-refreshing sheets...")
-            await refresh_all_events()
-        except Exception as e:
-            print(f"Auto-refresh error: {e}")
+        # 페이지는 바로 응답하고 새로고침은 백그라운드에서 진행 (/api/events는 기다리지 않고 저장된 이벤트를
+        # 바로 주므로, 새로고침 결과는 그 다음 조회(5분마다 loadEvents 등)부터 보임)
+        schedule_refresh(session_id)
     
     return templates.TemplateResponse("index.html", {
         "request": request, 
@@ -490,14 +809,7 @@ async def read_root(request: Request):
 @app.get("/auth/login")
 async def login(request: Request):
     try:
-        credentials_info = get_google_credentials_info()
-        redirect_uri = get_redirect_uri(request)
-        
-        flow = Flow.from_client_config(
-            credentials_info,
-            scopes=SCOPES,
-            redirect_uri=redirect_uri
-        )
+        flow = create_oauth_flow(request)
         
         authorization_url, state = flow.authorization_url(
             access_type='offline',
@@ -511,23 +823,23 @@ async def login(request: Request):
 
 @app.get("/auth/callback")
 async def auth_callback(request: Request, code: str = None, state: str = None):
-    global user_credentials
-    
     if not code:
         raise HTTPException(status_code=400, detail="인증 코드가 없습니다.")
     
     try:
-        credentials_info = get_google_credentials_info()
-        redirect_uri = get_redirect_uri(request)
+        flow = create_oauth_flow(request)
         
-        flow = Flow.from_client_config(
-            credentials_info,
-            scopes=SCOPES,
-            redirect_uri=redirect_uri
-        )
+        await asyncio.to_thread(flow.fetch_token, code=code)
         
-        flow.fetch_token(code=code)
-        user_credentials = flow.credentials
+        # 로그인마다 새 세션 id를 발급하고 자격 증명은 서버(SQLite)에만 저장
+        previous_session_id = request.session.get("session_id")
+        if previous_session_id:
+            delete_session(previous_session_id)
+            clear_google_caches(previous_session_id)
+        delete_stale_sessions(_SESSION_MAX_IDLE_DAYS)
+        session_id = secrets.token_urlsafe(32)
+        save_session_credentials(session_id, credentials_to_json(flow.credentials))
+        request.session["session_id"] = session_id
         
         return RedirectResponse("/")
         
@@ -535,24 +847,35 @@ async def auth_callback(request: Request, code: str = None, state: str = None):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/auth/logout")
-async def logout():
-    global user_credentials
-    user_credentials = None
+async def logout(request: Request):
+    session_id = request.session.pop("session_id", None)
+    if session_id:
+        delete_session(session_id)
+        clear_google_caches(session_id)
     return RedirectResponse("/")
 
 @app.get("/auth/status")
-async def auth_status():
-    global user_credentials
-    return JSONResponse({"authenticated": user_credentials is not None})
+async def auth_status(request: Request):
+    return ORJSONResponse({"authenticated": get_session_id(request) is not None})
 
 @app.post("/api/sheets")
-async def add_sheet(sheet_config: SheetConfig):
-    if not user_credentials:
+async def add_sheet(request: Request, sheet_config: SheetConfig):
+    session_id = get_session_id(request)
+    if not session_id:
         raise HTTPException(status_code=401, detail="Google 로그인이 필요합니다.")
     
     try:
         sheet_id, gid = extract_sheet_id_and_gid(sheet_config.url)
-        test_data = fetch_sheet_data(sheet_id, gid)
+        # modifiedTime을 값보다 먼저 받아 둠 (그 사이 수정이 있으면 다음 새로고침이 다시 받음)
+        # (gspread 호출은 블로킹이므로 이벤트 루프를 막지 않도록 스레드에서 실행)
+        try:
+            modified = await asyncio.to_thread(get_spreadsheet_modified_time, session_id, sheet_id)
+        except Exception as e:
+            modified = None
+            logger.debug("No modifiedTime for spreadsheet %s: %s", sheet_id, e)
+        
+        # 새로 추가하는 시트는 캐시를 건너뛰고 받아오며, 값 캐시에 들어간 이 결과가 아래 새로고침에 재사용됨
+        test_data = await asyncio.to_thread(fetch_sheet_data, session_id, sheet_id, gid, use_cache=False)
         
         if not test_data:
             raise ValueError("시트에서 데이터를 찾을 수 없습니다.")
@@ -566,9 +889,9 @@ async def add_sheet(sheet_config: SheetConfig):
             row_count=len(test_data)
         )
         
-        await refresh_events_for_sheet(db_sheet_id)
+        await refresh_events_for_sheet(session_id, db_sheet_id, fetched_modified=modified)
         
-        return JSONResponse({
+        return ORJSONResponse({
             "success": True, 
             "sheet": {
                 "id": db_sheet_id,
@@ -587,162 +910,322 @@ async def add_sheet(sheet_config: SheetConfig):
 @app.get("/api/sheets")
 async def get_sheets():
     sheets = db_get_sheets()
-    return JSONResponse(sheets)
+    return ORJSONResponse(sheets)
 
 @app.delete("/api/sheets/{sheet_id}")
 async def delete_sheet(sheet_id: int):
     success = db_delete_sheet(sheet_id)
+    _processed_sheet_data.pop(sheet_id, None)
+    _column_mappings_cache.pop(sheet_id, None)
+    _sheet_source_modified.pop(sheet_id, None)
     if not success:
         raise HTTPException(status_code=404, detail="시트를 찾을 수 없습니다.")
-    return JSONResponse({"success": True})
+    return ORJSONResponse({"success": True})
+
+@app.get("/api/sheets/{sheet_id}/rows/{row_index}")
+async def get_sheet_row(request: Request, sheet_id: int, row_index: int):
+    """이벤트의 원본 행 (details.row_index, 빈 셀 제외)"""
+    if not get_session_id(request):
+        raise HTTPException(status_code=401, detail="Google 로그인이 필요합니다.")
+    
+    row = await asyncio.to_thread(db_get_sheet_row, sheet_id, row_index)
+    if row is None:
+        raise HTTPException(status_code=404, detail="행을 찾을 수 없습니다.")
+    return ORJSONResponse({k: v for k, v in row.items() if v and str(v).strip()})
 
 @app.get("/api/events")
-async def get_events():
-    if not user_credentials:
-        return JSONResponse([])
+async def get_events(request: Request, sheet_id: Optional[int] = None, force: bool = False,
+                     date_from: Optional[date] = Query(None, alias="from"),
+                     date_to: Optional[date] = Query(None, alias="to"),
+                     limit: Optional[int] = Query(None, ge=1), offset: int = Query(0, ge=0)):
+    session_id = get_session_id(request)
+    if not session_id:
+        return ORJSONResponse([])
+    
+    # sheet_id가 있으면 해당 시트만 새로고침하고 SQL에서 바로 걸러서 반환
+    if force:
+        # force=1이면 캐시를 무시하고 새로고침이 끝난 결과를 반환
+        if sheet_id is None:
+            await refresh_all_events(session_id, force=True)
+        else:
+            await refresh_events_for_sheet(session_id, sheet_id, force=True)
+    else:
+        # 저장된 이벤트를 바로 반환하고 새로고침은 백그라운드에서 (다음 요청에 반영).
+        # 진행 중인 새로고침(예: 페이지 로드 때 시작된 것)도 기다리지 않음
+        schedule_refresh(session_id, sheet_id)
     
-    await refresh_all_events()
-    events = db_get_events()
-    return JSONResponse(events)
+    # from/to(포함)와 limit/offset은 SQL에서 적용해서 필요한 범위만 읽음
+    events = db_get_events(
+        sheet_id,
+        start_date=date_from.isoformat() if date_from else None,
+        end_date=date_to.isoformat() if date_to else None,
+        limit=limit, offset=offset
+    )
+    return ORJSONResponse(events)
 
 @app.get("/api/events/monthly/{year}/{month}")
-async def get_monthly_events(year: int, month: int):
+async def get_monthly_events(request: Request, year: int, month: int, force: bool = False):
     """특정 월의 이벤트를 마크다운 형식으로 반환"""
-    if not user_credentials:
-        return JSONResponse({"markdown": ""})
-    
-    await refresh_all_events()
-    events = db_get_events()
+    session_id = get_session_id(request)
+    if not session_id:
+        return ORJSONResponse({"markdown": ""})
     
-    # 해당 월의 이벤트만 필터링
-    monthly_events = []
-    for event in events:
-        try:
-            event_date = datetime.strptime(event['date'], '%Y-%m-%d')
-            if event_date.year == year and event_date.month == month:
-                monthly_events.append(event)
-        except ValueError:
-            continue
+    # /api/events처럼 저장된 이벤트로 바로 답하고 새로고침은 백그라운드에서 (간격 제한 포함).
+    # force=1일 때만 새로고침이 끝날 때까지 기다림
+    if force:
+        await refresh_all_events(session_id, force=True)
+    else:
+        schedule_refresh(session_id)
     
-    # 날짜순으로 정렬
-    monthly_events.sort(key=lambda x: x['date'])
+    # 해당 월의 이벤트만 SQLite에서 날짜 범위로 가져옴 (이미 날짜순으로 정렬되어 나옴)
+    if 1 <= month <= 12:
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        monthly_events = db_get_events_in_range(f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01")
+    else:
+        monthly_events = []
     
-    # 마크다운 형식으로 변환
-    markdown_content = f"# {year}년 {month}월 예약 현황\n\n"
+    # 마크다운 형식으로 변환 (조각을 모아 마지막에 한 번만 이어 붙임)
+    parts = [f"# {year}년 {month}월 예약 현황\n\n"]
     
     if not monthly_events:
-        markdown_content += "해당 월에 예약이 없습니다.\n"
+        parts.append("해당 월에 예약이 없습니다.\n")
     else:
         # 병원별로 그룹핑
         hospitals = {}
         for event in monthly_events:
-            hospital = event.get('hospital', '기타')
-            if hospital not in hospitals:
-                hospitals[hospital] = []
-            hospitals[hospital].append(event)
+            hospitals.setdefault(event.get('hospital', '기타'), []).append(event)
         
         for hospital, events in hospitals.items():
-            markdown_content += f"## {hospital}\n\n"
-            markdown_content += "| 날짜 | 시간 | 이름 | 연락처 | 시술내용 |\n"
-            markdown_content += "|------|------|------|---------|----------|\n"
+            parts.append(f"## {hospital}\n\n"
+                         "| 날짜 | 시간 | 이름 | 연락처 | 시술내용 |\n"
+                         "|------|------|------|---------|----------|\n")
             
             for event in events:
-                date = event['date']
-                time = event['time']
-                name = event['name']
                 phone = event.get('phone', '-')
                 procedure = event.get('details', {}).get('procedure', '-') if event.get('details') else '-'
-                markdown_content += f"| {date} | {time} | {name} | {phone} | {procedure} |\n"
+                parts.append(f"| {event['date']} | {event['time']} | {event['name']} | {phone} | {procedure} |\n")
             
-            markdown_content += "\n"
+            parts.append("\n")
+    
+    markdown_content = "".join(parts)
     
-    return JSONResponse({"markdown": markdown_content})
+    return ORJSONResponse({"markdown": markdown_content})
 
-async def refresh_all_events():
-    if not user_credentials:
+def schedule_refresh(session_id: str, sheet_id: Optional[int] = None):
+    """Start a background refresh unless one is in flight or one ran within the interval"""
+    task = _refresh_tasks.get(sheet_id)
+    if task is not None and not task.done():
         return
     
-    sheets = db_get_sheets()
-    for sheet in sheets:
-        await refresh_events_for_sheet(sheet["id"])
+    now = time.monotonic()
+    if now - _last_background_refresh.get(sheet_id, float('-inf')) < _BACKGROUND_REFRESH_INTERVAL:
+        return
+    _last_background_refresh[sheet_id] = now
+    
+    if sheet_id is None:
+        task = asyncio.create_task(refresh_all_events(session_id))
+    else:
+        task = asyncio.create_task(refresh_events_for_sheet(session_id, sheet_id))
+    task.add_done_callback(_log_refresh_failure)
+    _refresh_tasks[sheet_id] = task  # 완료 전까지 태스크 참조 유지
+
+def _log_refresh_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Auto-refresh error: %s", task.exception())
+
+async def _join_refresh(scope: Optional[int], force: bool, start):
+    """Await the refresh running for scope, starting it with start() if there is none"""
+    running = _running_refreshes.get(scope)
+    if running is not None and not running[0].done() and (running[1] or not force):
+        task = running[0]
+    else:
+        task = asyncio.create_task(start())
+        _running_refreshes[scope] = (task, force)
+        
+        def forget(done: asyncio.Task):
+            if _running_refreshes.get(scope, (None,))[0] is done:
+                del _running_refreshes[scope]
+        task.add_done_callback(forget)
+    
+    # 기다리던 요청이 끊겨도 다른 호출자가 공유하는 새로고침은 취소되지 않도록
+    await asyncio.shield(task)
 
-async def refresh_events_for_sheet(db_sheet_id: int):
-    if not user_credentials:
+async def refresh_all_events(session_id: str, force: bool = False):
+    if get_user_credentials(session_id) is None:
         return
     
-    from database import get_sheet_by_id
+    await _join_refresh(None, force, lambda: _refresh_all_events(session_id, force))
+
+async def _refresh_all_events(session_id: str, force: bool):
+    # 스프레드시트마다 Google API 호출을 기다리므로 스레드에서 동시에 처리 (DB 연결은 스레드별)
+    spreadsheets: Dict[str, List[Dict]] = {}
+    for sheet in db_get_sheets():
+        spreadsheets.setdefault(sheet["sheet_id"], []).append(sheet)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_refresh_spreadsheet_sync, session_id, sheets, force) for sheets in spreadsheets.values()),
+        return_exceptions=True
+    )
+    # 한 스프레드시트의 실패가 나머지를 막지 않도록 모아 받은 예외를 여기서 기록
+    for spreadsheet_id, result in zip(spreadsheets, results):
+        if isinstance(result, Exception):
+            logger.warning("Refresh failed for spreadsheet %s", spreadsheet_id, exc_info=result)
+
+async def refresh_events_for_sheet(session_id: str, db_sheet_id: int, force: bool = False,
+                                   fetched_modified: Optional[str] = None):
+    if get_user_credentials(session_id) is None:
+        return
+    
+    await _join_refresh(db_sheet_id, force, lambda: _refresh_events_for_sheet(session_id, db_sheet_id, force, fetched_modified))
+
+async def _refresh_events_for_sheet(session_id: str, db_sheet_id: int, force: bool, fetched_modified: Optional[str] = None):
+    sheet = await asyncio.to_thread(get_sheet_by_id, db_sheet_id)
+    if sheet:
+        await asyncio.to_thread(_refresh_spreadsheet_sync, session_id, [sheet], force, fetched_modified)
+
+def _refresh_spreadsheet_sync(session_id: str, sheets: List[Dict], force: bool = False,
+                              fetched_modified: Optional[str] = None):
+    """같은 스프레드시트에 속한 시트(gid)들은 batchGet 한 번으로 받아 캐시에 채운 뒤 시트별로 처리.
+    
+    fetched_modified: 호출한 쪽이 이 modifiedTime을 받은 뒤 값을 새로 받아 캐시에 넣어 뒀음 (add_sheet)
+    """
+    # 값 전체 대신 modifiedTime만 먼저 받아서, 마지막 저장 이후 수정되지 않은 시트는 건너뜀
+    if fetched_modified is not None:
+        modified = fetched_modified
+    else:
+        try:
+            modified = get_spreadsheet_modified_time(session_id, sheets[0]["sheet_id"])
+        except Exception as e:
+            modified = None
+            logger.debug("No modifiedTime for spreadsheet %s, fetching values: %s", sheets[0]["sheet_id"], e)
+    
+    if modified is not None and not force:
+        changed = []
+        for sheet in sheets:
+            if _sheet_source_modified.get(sheet["id"]) == modified:
+                logger.info("Sheet %s not modified since last refresh", sheet['name'])
+            else:
+                changed.append(sheet)
+        sheets = changed
+    
+    # modifiedTime을 받았으면 남은 시트는 수정된 것이므로 캐시(TTL이 새로고침 간격보다 김)에
+    # 남아 있을 수정 전 데이터 대신 새로 받음 (호출한 쪽이 방금 받아 둔 값은 그대로 사용)
+    fresh = force or (modified is not None and fetched_modified is None)
+    
+    if len(sheets) > 1:
+        try:
+            fetch_sheets_data(session_id, sheets[0]["sheet_id"], [sheet["gid"] for sheet in sheets], use_cache=not fresh)
+            fresh = False  # 방금 받은 데이터가 캐시에 있으므로 아래에서는 캐시를 사용
+        except Exception as e:
+            logger.warning("Batch fetch failed for spreadsheet %s: %s", sheets[0]["sheet_id"], e)
+    
+    for sheet in sheets:
+        if _refresh_sheet_sync(session_id, sheet["id"], fresh) and modified is not None:
+            _sheet_source_modified[sheet["id"]] = modified
+
+def _refresh_sheet_sync(session_id: str, db_sheet_id: int, force: bool = False) -> bool:
+    """시트 데이터를 가져와 이벤트를 다시 저장 (블로킹 I/O라서 이벤트 루프 밖 스레드에서 실행).
+    
+    이번에 받은 데이터로 이벤트를 저장했으면 True (이전과 같은 데이터라 건너뛰었거나 실패하면 False)
+    """
     sheet = get_sheet_by_id(db_sheet_id)
     if not sheet:
-        return
+        return False
         
     try:
-        print(f"\n=== Processing sheet: {sheet['name']} ===")
+        logger.info("=== Processing sheet: %s ===", sheet['name'])
         
-        clear_events_for_sheet(db_sheet_id)
-        data = fetch_sheet_data(sheet["sheet_id"], sheet["gid"])
+        data = fetch_sheet_data(session_id, sheet["sheet_id"], sheet["gid"], use_cache=not force)
         
         if not data:
-            print(f"No data found in sheet {sheet['name']}")
-            return
+            logger.warning("No data found in sheet %s", sheet['name'])
+            replace_events_for_sheet(db_sheet_id, [], rows=[])
+            return True
+        
+        processed = (data, sheet["name"], sheet["color"])
+        previous = _processed_sheet_data.get(db_sheet_id)
+        if previous is not None and previous[0] is data and previous[1:] == processed[1:]:
+            logger.info("Sheet %s unchanged since last refresh", sheet['name'])
+            return False
         
-        print(f"Data rows: {len(data)}")
-        column_mappings = find_column_mappings(data)
-        print(f"Column mappings: {column_mappings}")
+        logger.info("Data rows: %s", len(data))
+        column_mappings = cached_column_mappings(db_sheet_id, data)
+        logger.debug("Column mappings: %s", column_mappings)
         
         sheet_hospital = extract_hospital_from_data(sheet['name'], data)
-        print(f"Sheet-level hospital: '{sheet_hospital}'")
+        logger.debug("Sheet-level hospital: '%s'", sheet_hospital)
+        
+        events = []
+        hospital_index = None  # 백업 병원 검색용, 처음 필요할 때 한 번만 만듦
+        # 행마다 로거 레벨을 확인하지 않도록 한 번만 확인 (LOG_LEVEL=DEBUG일 때만 행별 로그)
+        debug = logger.isEnabledFor(logging.DEBUG)
         
-        events_count = 0
+        # 이름과 날짜가 둘 다 있어야 이벤트가 되므로, 두 셀만 먼저 보고 나머지 행은
+        # 전화번호 검색/날짜 파싱 없이 건너뜀 (이름/날짜 컬럼이 없으면 이벤트도 없음)
+        name_key, date_key = column_mappings['name'], column_mappings['date']
         
-        for row_idx, row in enumerate(data):
+        for row_idx, row in enumerate(data if name_key and date_key else ()):
             if not row:
                 continue
+            name_value = row.get(name_key)
+            if not name_value or not row.get(date_key) or not str(name_value).strip():
+                continue
             
             extracted_data = extract_meaningful_data(row, column_mappings)
             
             if extracted_data['name'] and extracted_data['date']:
-                print(f"\n--- Processing {extracted_data['name']} at row {row_idx} ---")
-                
-                # 병원명 결정 과정 상세 로깅
-                hospital_from_near = find_hospital_near_name(data, row_idx, extracted_data['name'])
-                print(f"Hospital from near name: '{hospital_from_near}'")
+                if debug:
+                    logger.debug("--- Processing %s at row %s ---", extracted_data['name'], row_idx)
                 
-                hospital_name = (
-                    sheet_hospital or 
-                    hospital_from_near or 
-                    sheet['name']
-                )
+                # 시트 단위 병원명이 있으면 주변 검색 결과는 쓰이지 않으므로 건너뜀
+                if sheet_hospital:
+                    hospital_name = sheet_hospital
+                else:
+                    if hospital_index is None:
+                        hospital_index = build_hospital_row_index(data)
+                    
+                    # 병원명 결정 과정 상세 로깅
+                    hospital_from_near = find_hospital_near_name(data, row_idx, extracted_data['name'], hospital_index)
+                    if debug:
+                        logger.debug("Hospital from near name: '%s'", hospital_from_near)
+                    
+                    hospital_name = hospital_from_near or sheet['name']
                 
-                print(f"Final hospital for {extracted_data['name']}: '{hospital_name}'")
+                if debug:
+                    logger.debug("Final hospital for %s: '%s'", extracted_data['name'], hospital_name)
                 
-                db_add_event(
-                    sheet_id=db_sheet_id,
-                    title=f"{hospital_name}_{extracted_data['name']}",
-                    name=extracted_data['name'],
-                    date=extracted_data['date'],
-                    time=extracted_data['time'],
-                    sheet_name=sheet["name"],
-                    color=sheet["color"],
-                    hospital=hospital_name,
-                    phone=extracted_data['phone'],
-                    details={
+                events.append({
+                    'title': f"{hospital_name}_{extracted_data['name']}",
+                    'name': extracted_data['name'],
+                    'date': extracted_data['date'],
+                    'time': extracted_data['time'],
+                    'sheet_name': sheet["name"],
+                    'color': sheet["color"],
+                    'hospital': hospital_name,
+                    'phone': extracted_data['phone'],
+                    'details': {
                         'procedure': extracted_data['procedure'],
-                        'row_index': row_idx + 1,
-                        'original_data': dict(row)
+                        # 원본 행은 시트 스냅샷에 한 번만 저장 (/api/sheets/{id}/rows/{row_index})
+                        'row_index': row_idx + 1
                     }
-                )
-                events_count += 1
+                })
                 
-                if events_count <= 10:  # 더 많은 예제 보기
-                    print(f"  Event {events_count}: {extracted_data['name']} - {extracted_data['date']} at {hospital_name}")
+                if debug and len(events) <= 10:  # 더 많은 예제 보기
+                    logger.debug("Event %s: %s - %s at %s", len(events), extracted_data['name'], extracted_data['date'], hospital_name)
+        
+        # 기존 이벤트 삭제와 새 이벤트·스냅샷 저장을 한 트랜잭션으로
+        replace_events_for_sheet(db_sheet_id, events, rows=data)
+        _processed_sheet_data[db_sheet_id] = processed
         
-        print(f"\nSheet {sheet['name']} processed: {events_count} events found\n")
+        logger.info("Sheet %s processed: %s events found", sheet['name'], len(events))
+        return True
                         
     except Exception as e:
-        print(f"Error processing sheet {sheet['name']}: {e}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error processing sheet %s: %s", sheet['name'], e)
+        return False
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvicorn[standard]이 설치되어 있으면 uvloop/httptools가 자동으로 쓰임.
+    # WEB_CONCURRENCY>1이면 여러 워커 프로세스 (세션을 공유하려면 SECRET_KEY 필요)
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
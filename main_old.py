@@ -217,12 +217,7 @@ async def refresh_events_for_sheet(db_sheet_id: int):
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
-        print(f"Exception in get_google_credentials_info: {e}")
-        print(f"Exception type: {type(e)}")
-        import traceback
-        print(f"Full traceback: {traceback.format_exc()}")
-        raise e  # Re-raise the original exception
-    
+
 def get_redirect_uri(request: Request):
     """Get the appropriate redirect URI based on the request"""
     base_url = str(request.base_url).rstrip('/')
@@ -807,47 +802,6 @@ async def login(request: Request):
         print(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"로그인 시작 중 오류: {str(e)}")
 
-@app.get("/auth/callback")
-async def auth_callback(request: Request, code: str = None, state: str = None):
-    """Handle OAuth callback"""
-    global user_credentials
-    
-    print(f"OAuth callback received - Code: {'Yes' if code else 'No'}, State: {state}")
-    
-    if not code:
-        print("No authorization code received")
-        raise HTTPException(status_code=400, detail="인증 코드가 없습니다.")
-    
-    try:
-        print("Loading credentials for callback...")
-        credentials_info = get_google_credentials_info()
-        
-        redirect_uri = get_redirect_uri(request)
-        print(f"Using redirect URI: {redirect_uri}")
-        
-        flow = Flow.from_client_config(
-            credentials_info,
-            scopes=SCOPES,
-            redirect_uri=redirect_uri
-        )
-        print("Flow created for token exchange")
-        
-        print("Fetching token...")
-        flow.fetch_token(code=code)
-        user_credentials = flow.credentials
-        
-        print("Token obtained successfully")
-        print(f"Credentials valid: {user_credentials.valid}")
-        
-        return RedirectResponse("/")
-        
-    except Exception as e:
-        print(f"Callback error: {e}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=400, detail=f"인증 실패: {str(e)}")
-    
 @app.get("/auth/callback")
 async def auth_callback(request: Request, code: str = None, state: str = None):
     """Handle OAuth callback"""
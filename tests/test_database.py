@@ -0,0 +1,28 @@
+import pytest
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh database file per test (the module keeps one connection per thread)"""
+    database.close_connection()
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "sheets_calendar.db"))
+    database.init_database()
+    yield database
+    database.close_connection()
+
+
+def test_replace_events_for_sheet_keeps_ints_wider_than_64_bits(db):
+    # numericise_all turns 20+ digit cells (serial numbers, joined IDs) into ints orjson can't encode
+    sheet_id = db.add_sheet("s", "https://docs.google.com/spreadsheets/d/abc/edit#gid=0", "#fff", "abc", "0")
+    rows = [{"A": 2**70, "B": 2**64 - 1, "C": -2**63 - 1, "D": "홍길동"}]
+    event = {
+        "title": "t", "name": "홍길동", "date": "2024-01-05", "time": "09:00",
+        "sheet_name": "s", "color": "#fff", "details": {"serial": 2**70, "row_index": 1},
+    }
+    
+    db.replace_events_for_sheet(sheet_id, [event], rows=rows)
+    
+    assert db.get_sheet_row(sheet_id, 1) == {"A": str(2**70), "B": 2**64 - 1, "C": str(-2**63 - 1), "D": "홍길동"}
+    assert db.get_all_events(sheet_id)[0]["details"] == {"serial": str(2**70), "row_index": 1}